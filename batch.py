@@ -0,0 +1,182 @@
+import json
+import zlib
+from argparse import ArgumentParser
+from hashlib import md5
+from io import StringIO
+from os import makedirs, path
+from queue import Queue
+from threading import Thread
+from time import time
+
+from pack import FORMATS, PackWriter
+
+
+class OutputWriter:
+    def __init__(self, vanilla, outdir, basename, fmt, queue_size=4,
+                 threads=1, pack=None, random_degree=None):
+        self.vanilla = vanilla
+        self.outdir = outdir
+        self.basename = basename
+        self.fmt = fmt
+        self.pack = pack
+        self.random_degree = random_degree
+        self.queue = Queue(maxsize=queue_size)
+        self.records = []
+        self.errors = []
+        self.threads = [Thread(target=self.run, daemon=True)
+                        for _ in range(threads)]
+        for t in self.threads:
+            t.start()
+
+    def encode(self, data):
+        if self.fmt == 'rom':
+            return data
+        from randomizer import make_ips_patch
+        patch = make_ips_patch(self.vanilla, data)
+        if self.fmt == 'ips.gz':
+            patch = zlib.compress(patch, 9)
+        return patch
+
+    def write(self, seed, flags, data, spoiler=None, fallbacks=()):
+        encoded = self.encode(data)
+        if self.pack is not None:
+            checksum = md5(data)
+            offset = self.pack.append(seed, flags, self.random_degree,
+                                      self.fmt, encoded, spoiler,
+                                      checksum.digest())
+            record = {'seed': seed, 'flags': flags, 'offset': offset,
+                      'md5': checksum.hexdigest(), 'size': len(encoded)}
+            if fallbacks:
+                record['fallbacks'] = list(fallbacks)
+            return record
+
+        filename = path.join(self.outdir, '{0}.{1}.{2}'.format(
+            self.basename, seed, self.fmt if self.fmt != 'rom' else 'gb'))
+        with open(filename, 'wb') as f:
+            f.write(encoded)
+        record = {'seed': seed, 'flags': flags,
+                  'filename': path.basename(filename),
+                  'md5': md5(data).hexdigest(),
+                  'size': len(encoded)}
+        if spoiler is not None:
+            spoiler_filename = path.join(
+                self.outdir, '{0}.{1}.spoiler.jsonl'.format(
+                    self.basename, seed))
+            with open(spoiler_filename, 'w') as f:
+                f.write(spoiler)
+            record['spoiler'] = path.basename(spoiler_filename)
+        if fallbacks:
+            record['fallbacks'] = list(fallbacks)
+        return record
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                self.records.append(self.write(*item))
+            except Exception as e:
+                self.errors.append((item[0], e))
+            finally:
+                self.queue.task_done()
+
+    def put(self, seed, flags, data, spoiler=None, fallbacks=()):
+        if self.errors:
+            seed, error = self.errors[0]
+            raise Exception('Failed writing seed {0}: {1}'.format(
+                seed, error))
+        self.queue.put((seed, flags, data, spoiler, fallbacks))
+
+    def close(self):
+        for t in self.threads:
+            self.queue.put(None)
+        for t in self.threads:
+            t.join()
+        if self.errors:
+            seed, error = self.errors[0]
+            raise Exception('Failed writing seed {0}: {1}'.format(
+                seed, error))
+        return sorted(self.records, key=lambda r: r['seed'])
+
+
+def run_batch(sourcefile, seeds, flags, random_degree, outdir,
+              fmt='ips', custom_degrees=None, queue_size=4, threads=1,
+              spoilers=False, memory_report=None, packfile=None,
+              budget=None):
+    from memtrack import enable_tracking
+    from randomizer import generate
+
+    with open(sourcefile, 'rb') as f:
+        vanilla = f.read()
+    basename = path.splitext(path.basename(sourcefile))[0]
+    if packfile is None:
+        makedirs(outdir, exist_ok=True)
+        pack = None
+    else:
+        pack = PackWriter(packfile)
+
+    tracker = enable_tracking() if memory_report else None
+    writer = OutputWriter(vanilla, outdir, basename, fmt,
+                          queue_size=queue_size, threads=threads, pack=pack,
+                          random_degree=random_degree)
+    start = time()
+    try:
+        for seed in seeds:
+            spoiler = StringIO() if spoilers else None
+            metadata = {}
+            data = generate(vanilla, seed, flags, random_degree,
+                            custom_degrees, spoiler=spoiler, budget=budget,
+                            metadata=metadata)
+            if spoiler is not None:
+                spoiler = spoiler.getvalue()
+            writer.put(seed, metadata['flags'], data, spoiler,
+                       metadata['fallbacks'])
+    finally:
+        records = writer.close()
+        if pack is not None:
+            pack.close()
+        if tracker is not None:
+            tracker.save(memory_report)
+
+    if pack is None:
+        with open(path.join(outdir, 'manifest.jsonl'), 'a') as f:
+            for r in records:
+                f.write(json.dumps(r) + '\n')
+    return records, time() - start
+
+
+def main(args=None):
+    parser = ArgumentParser(prog='randomizer.py --batch')
+    parser.add_argument('rom')
+    parser.add_argument('--seed', type=int, default=int(time()),
+                        help='first seed of the batch')
+    parser.add_argument('--count', type=int, default=1)
+    parser.add_argument('--flags', default='')
+    parser.add_argument('--degree', type=float, default=0.5)
+    parser.add_argument('--output', default='batch')
+    parser.add_argument('--format', choices=FORMATS, default='ips')
+    parser.add_argument('--queue-size', type=int, default=4)
+    parser.add_argument('--writers', type=int, default=1)
+    parser.add_argument('--spoilers', action='store_true')
+    parser.add_argument('--memory-report', default=None,
+                        help='save per-class memory usage to this file')
+    parser.add_argument('--pack', default=None,
+                        help='append all outputs to this pack file')
+    parser.add_argument('--budget', type=int, default=None,
+                        help='random draws each table may make before it '
+                             'is left vanilla')
+    args = parser.parse_args(args)
+
+    seeds = range(args.seed, args.seed + args.count)
+    records, duration = run_batch(
+        args.rom, seeds, args.flags, args.degree, args.output,
+        fmt=args.format, queue_size=args.queue_size, threads=args.writers,
+        spoilers=args.spoilers, memory_report=args.memory_report,
+        packfile=args.pack, budget=args.budget)
+    print('Generated {0} seeds in {1:.1f} seconds.'.format(
+        len(records), duration))
+
+
+if __name__ == '__main__':
+    main()
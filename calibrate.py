@@ -0,0 +1,189 @@
+import json
+from argparse import ArgumentParser
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from hashlib import md5
+from time import time
+
+from randomizer import (
+    AttributeObject, ChestObject, FormationCountObject, FormationObject,
+    ItemPriceObject, MonsterObject, MutantSkillsObject, ShopObject,
+    get_rom_label, randomize_file)
+
+
+MONSTER_STATS = ['hp', 'strength', 'agility', 'mana', 'defense']
+NUM_BINS = 20
+CHUNK_SIZE = 25
+
+
+def stat_rank(strength, agility, mana, defense):
+    rank = strength + agility + mana + defense
+    if mana > 0:
+        return rank / 4
+    return rank / 3
+
+
+def get_value(o, attribute, old=False):
+    if old:
+        return o.old_data[attribute]
+    return getattr(o, attribute)
+
+
+def monster_rank(index, old=False):
+    m = MonsterObject.get(index)
+    return stat_rank(*[get_value(m, a, old) for a in
+                       ['strength', 'agility', 'mana', 'defense']])
+
+
+def formation_rank(f, old=False):
+    # FormationObject.rank is cached, so it is recomputed from the tables
+    rank = 0
+    enemy_indexes = get_value(f, 'enemy_indexes', old)
+    for c in get_value(f, 'counts', old):
+        fcount = FormationCountObject.get(c & 0x1f)
+        for count, enemy_index in zip(get_value(fcount, 'counts', old),
+                                      enemy_indexes):
+            rank += count * monster_rank(enemy_index, old)
+    return rank
+
+
+def item_rank(index):
+    rank = AttributeObject.get(index).rank
+    if rank < 0 or rank >= 9999999:
+        return None
+    return rank
+
+
+def mean(values):
+    values = [v for v in values if v is not None]
+    if not values:
+        return None
+    return sum(values) / len(values)
+
+
+def measure(distributions):
+    for m in MonsterObject.every:
+        if not m.intershuffle_valid:
+            continue
+        for stat in MONSTER_STATS:
+            distributions['monster_' + stat].append(
+                getattr(m, stat) - m.old_data[stat])
+
+    for f in FormationObject.every:
+        old_rank = formation_rank(f, old=True)
+        if old_rank > 0:
+            distributions['formation_rank_shift'].append(
+                (formation_rank(f) - old_rank) / old_rank)
+
+    for s in ShopObject.every:
+        old_items = [i for i in s.old_data['item_indexes'] if i < 0xFF]
+        new_items = [i for i in s.item_indexes if i < 0xFF]
+        old_price = mean([ItemPriceObject.get(i).old_data['price']
+                          for i in old_items])
+        new_price = mean([ItemPriceObject.get(i).price for i in new_items])
+        if old_price and new_price is not None:
+            distributions['shop_price_drift'].append(
+                (new_price - old_price) / old_price)
+        old_rank = mean([item_rank(i) for i in old_items])
+        new_rank = mean([item_rank(i) for i in new_items])
+        if old_rank and new_rank is not None:
+            distributions['shop_rank_drift'].append(
+                (new_rank - old_rank) / old_rank)
+
+    for mu in MutantSkillsObject.every:
+        old_rank = AttributeObject.get(mu.old_data['skill_index']).rank
+        new_rank = AttributeObject.get(mu.skill_index).rank
+        if old_rank >= 0 and new_rank >= 0:
+            distributions['mutant_skill_rank'].append(new_rank - old_rank)
+
+    for c in ChestObject.every:
+        old_rank = item_rank(c.old_contents)
+        new_rank = item_rank(c.contents)
+        if old_rank and new_rank is not None:
+            distributions['chest_item_rank'].append(
+                (new_rank - old_rank) / old_rank)
+
+
+def run_chunk(sourcefile, label, tables_list, flags, degree, seeds):
+    # the checksum lets every seed load the tables from the snapshot
+    with open(sourcefile, 'rb') as f:
+        checksum = md5(f.read()).hexdigest()
+    distributions = defaultdict(list)
+    for seed in seeds:
+        randomize_file(sourcefile, label, tables_list, seed, flags, degree,
+                       checksum=checksum)
+        measure(distributions)
+    return degree, {k: Counter(round(v, 3) for v in values)
+                    for (k, values) in distributions.items()}
+
+
+def summarize(counter, low, high):
+    total = sum(counter.values())
+    average = sum(k * v for (k, v) in counter.items()) / total
+    variance = sum(((k - average) ** 2) * v
+                   for (k, v) in counter.items()) / total
+    width = ((high - low) / NUM_BINS) or 1
+    histogram = [0] * NUM_BINS
+    for value, count in counter.items():
+        histogram[min(int((value - low) / width), NUM_BINS-1)] += count
+    return {'count': total, 'mean': round(average, 4),
+            'stdev': round(variance ** 0.5, 4),
+            'low': low, 'high': high, 'histogram': histogram}
+
+
+def calibrate(sourcefile, degrees, num_seeds, flags='', first_seed=0,
+              workers=None):
+    with open(sourcefile, 'rb') as f:
+        label, tables_list = get_rom_label(f.read())
+    seeds = list(range(first_seed, first_seed + num_seeds))
+    chunks = [seeds[i:i+CHUNK_SIZE] for i in range(0, len(seeds),
+                                                    CHUNK_SIZE)]
+    results = defaultdict(lambda: defaultdict(Counter))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(run_chunk, sourcefile, label, tables_list,
+                               flags, degree, chunk)
+                   for degree in degrees for chunk in chunks]
+        for future in futures:
+            degree, counters = future.result()
+            for key, counter in counters.items():
+                results[key][degree].update(counter)
+
+    report = {}
+    for key, by_degree in sorted(results.items()):
+        low = min(min(c) for c in by_degree.values())
+        high = max(max(c) for c in by_degree.values())
+        report[key] = {str(degree): summarize(by_degree[degree], low, high)
+                       for degree in sorted(by_degree)}
+    return report
+
+
+def main(args=None):
+    parser = ArgumentParser(prog='randomizer.py --calibrate')
+    parser.add_argument('rom')
+    parser.add_argument('--degrees', default='0,0.25,0.5,0.75,1')
+    parser.add_argument('--seeds', type=int, default=1000)
+    parser.add_argument('--first-seed', type=int, default=0)
+    parser.add_argument('--flags', default='')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--output', default='calibration.json')
+    args = parser.parse_args(args)
+
+    degrees = [float(d) for d in args.degrees.split(',')]
+    start = time()
+    report = calibrate(args.rom, degrees, args.seeds, flags=args.flags,
+                       first_seed=args.first_seed, workers=args.workers)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=1)
+
+    for key, by_degree in report.items():
+        print(key)
+        for degree, summary in by_degree.items():
+            print('  {0:>5} {1:>10} {2:>10}  {3}'.format(
+                degree, summary['mean'], summary['stdev'],
+                ' '.join(str(c) for c in summary['histogram'])))
+    print('Measured {0} seeds at {1} degrees in {2:.1f} seconds.'.format(
+        args.seeds, len(degrees), time() - start))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+import json
+import re
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from os import path
+from random import Random
+from sys import exit
+from time import time
+from traceback import extract_tb
+
+from randomizer import (ALL_OBJECTS, NameMixin, generate, get_all_flags,
+                        get_display_flags, get_title_lines)
+
+
+ROOT = path.dirname(path.abspath(__file__))
+DEGREES = [0, 0.1, 0.25, 0.5, 0.75, 0.9, 1]
+BATCH_SIZE = 512
+NUMBER = re.compile(r'\b(0x)?[0-9a-fA-F]*[0-9][0-9a-fA-F]*\b')
+
+VANILLA = None
+
+
+def init_worker(romfile):
+    global VANILLA
+    with open(romfile, 'rb') as f:
+        VANILLA = f.read()
+
+
+def get_signature(e):
+    frames = extract_tb(e.__traceback__)
+    local = [f for f in frames
+             if path.dirname(path.abspath(f.filename)) == ROOT]
+    frame = (local or frames)[-1]
+    message = NUMBER.sub('#', str(e).strip())
+    return '{0} {1}:{2} {3}: {4}'.format(
+        type(e).__name__, path.basename(frame.filename), frame.lineno,
+        frame.name, message)
+
+
+def run_case(case):
+    try:
+        generate(VANILLA, case['seed'], case['flags'], case['degree'],
+                 case['degrees'])
+    except Exception as e:
+        return get_signature(e)
+    return None
+
+
+def make_case(rng, flags, custom_keys):
+    chosen = ''.join(f for f in flags if rng.random() < 0.5)
+    chosen = chosen or rng.choice(flags)
+    degrees = {k: round(rng.random(), 2) for k in custom_keys
+               if k in chosen and rng.random() < 0.25}
+    return {'seed': rng.randrange(1 << 31), 'flags': chosen,
+            'degree': round(rng.random(), 2), 'degrees': degrees}
+
+
+def get_smaller_cases(case):
+    for f in case['flags']:
+        if len(case['flags']) > 1:
+            flags = case['flags'].replace(f, '')
+            degrees = {k: v for (k, v) in case['degrees'].items()
+                       if k in flags}
+            yield dict(case, flags=flags, degrees=degrees)
+    for k in sorted(case['degrees']):
+        degrees = dict(case['degrees'])
+        del(degrees[k])
+        yield dict(case, degrees=degrees)
+
+
+def shrink(pool, case, signature):
+    # drop flags and custom degrees while the same failure still happens
+    while True:
+        candidates = list(get_smaller_cases(case))
+        results = pool.map(run_case, candidates)
+        smaller = [c for (c, r) in zip(candidates, results)
+                   if r == signature]
+        if not smaller:
+            break
+        case = smaller[0]
+
+    candidates = [dict(case, degree=d) for d in DEGREES if d < case['degree']]
+    results = pool.map(run_case, candidates)
+    for candidate, result in zip(candidates, results):
+        if result == signature:
+            return candidate
+    return case
+
+
+def fuzz(romfile, num_cases, fuzz_seed, time_limit=None, workers=None):
+    rng = Random(fuzz_seed)
+    flags = get_all_flags()
+    custom_keys = sorted({o.custom_random_enable for o in ALL_OBJECTS
+                          if hasattr(o, 'custom_random_enable')})
+    cases = [make_case(rng, flags, custom_keys) for _ in range(num_cases)]
+
+    start = time()
+    failures = {}
+    done = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(romfile,)) as pool:
+        for i in range(0, len(cases), BATCH_SIZE):
+            if time_limit is not None and time() - start > time_limit:
+                break
+            batch = cases[i:i+BATCH_SIZE]
+            for case, signature in zip(batch, pool.map(run_case, batch,
+                                                       chunksize=16)):
+                done += 1
+                if signature is None:
+                    continue
+                if signature not in failures:
+                    failures[signature] = {'signature': signature,
+                                           'count': 0, 'case': case}
+                failures[signature]['count'] += 1
+
+        for failure in failures.values():
+            failure['minimal'] = shrink(pool, failure['case'],
+                                        failure['signature'])
+    return done, sorted(failures.values(), key=lambda f: -f['count'])
+
+
+def check_title_flags():
+    # every combination of fallbacks has to fit in the title screen font;
+    # "CUSTOM" is the longest degree string, so it is the worst case
+    flags = get_all_flags() + 'v'
+    names = sorted(o.__name__ for o in ALL_OBJECTS
+                   if hasattr(o, 'flag'))
+    failures = {}
+    for mask in range(1 << len(names)):
+        fallbacks = [n for (i, n) in enumerate(names) if mask & (1 << i)]
+        display = get_display_flags(flags, fallbacks)
+        try:
+            for line in get_title_lines(0, display, 'CUSTOM'):
+                NameMixin.encode(line)
+        except Exception as e:
+            signature = 'title {0}: {1!r}'.format(type(e).__name__, display)
+            if signature not in failures:
+                failures[signature] = {'signature': signature, 'count': 0,
+                                       'fallbacks': fallbacks}
+            failures[signature]['count'] += 1
+    return sorted(failures.values(), key=lambda f: -f['count'])
+
+
+def main(args=None):
+    parser = ArgumentParser(prog='randomizer.py --fuzz')
+    parser.add_argument('rom')
+    parser.add_argument('--cases', type=int, default=1000)
+    parser.add_argument('--fuzz-seed', type=int, default=int(time()),
+                        help='seed for choosing the cases')
+    parser.add_argument('--time', type=float, default=None,
+                        help='stop sampling after this many seconds')
+    parser.add_argument('--output', default=None,
+                        help='save the failures to this file')
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args(args)
+
+    start = time()
+    done, failures = fuzz(args.rom, args.cases, args.fuzz_seed,
+                          time_limit=args.time, workers=args.workers)
+    failures = check_title_flags() + failures
+    for failure in failures:
+        print(json.dumps(failure))
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            for failure in failures:
+                f.write(json.dumps(failure) + '\n')
+    print('Ran {0} cases (fuzz seed {1}) in {2:.1f} seconds, {3} distinct '
+          'failures.'.format(done, args.fuzz_seed, time() - start,
+                             len(failures)))
+    if failures:
+        exit(1)
+
+
+if __name__ == '__main__':
+    main()
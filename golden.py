@@ -0,0 +1,111 @@
+import json
+import zlib
+from argparse import ArgumentParser
+from base64 import b64decode, b64encode
+from concurrent.futures import ProcessPoolExecutor
+from hashlib import md5
+from sys import exit
+from time import time
+
+from randomizer import (
+    apply_ips_patch, generate, get_rom_label, make_ips_patch)
+from romdiff import RomLayout, diff_roms
+
+
+VANILLA = None
+
+
+def init_worker(romfile):
+    global VANILLA
+    with open(romfile, 'rb') as f:
+        data = f.read()
+    VANILLA = (data,) + get_rom_label(data)
+
+
+def generate_case(case):
+    return generate(VANILLA[0], case['seed'], case['flags'], case['degree'],
+                    case.get('degrees'))
+
+
+def first_difference(expected, actual):
+    _, label, tables_list = VANILLA
+    changes = diff_roms(RomLayout(tables_list), expected, actual)
+    if changes:
+        return changes[0]
+    return None
+
+
+def record_case(case):
+    data = generate_case(case)
+    patch = make_ips_patch(VANILLA[0], data)
+    return dict(case, md5=md5(data).hexdigest(),
+                patch=b64encode(zlib.compress(patch, 9)).decode('ascii'))
+
+
+def check_case(case):
+    data = generate_case(case)
+    checksum = md5(data).hexdigest()
+    if checksum == case['md5']:
+        return None
+
+    patch = zlib.decompress(b64decode(case['patch']))
+    expected = apply_ips_patch(VANILLA[0], patch)
+    return {'seed': case['seed'], 'flags': case['flags'],
+            'degree': case['degree'], 'expected_md5': case['md5'],
+            'actual_md5': checksum,
+            'difference': first_difference(expected, data)}
+
+
+def run_cases(romfile, function, cases, workers=None):
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(romfile,)) as pool:
+        return list(pool.map(function, cases, chunksize=8))
+
+
+def make_cases(seeds, flag_sets, degrees):
+    return [{'seed': seed, 'flags': flags, 'degree': degree}
+            for flags in flag_sets for degree in degrees for seed in seeds]
+
+
+def main(args=None):
+    parser = ArgumentParser(prog='randomizer.py --golden')
+    parser.add_argument('rom')
+    parser.add_argument('corpus')
+    parser.add_argument('--record', action='store_true',
+                        help='record a new corpus instead of checking it')
+    parser.add_argument('--seeds', type=int, default=100)
+    parser.add_argument('--first-seed', type=int, default=0)
+    parser.add_argument('--flags', default=',efikmstu',
+                        help='comma-separated flag sets')
+    parser.add_argument('--degrees', default='0,0.5,1')
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args(args)
+
+    start = time()
+    if args.record:
+        cases = make_cases(
+            range(args.first_seed, args.first_seed + args.seeds),
+            args.flags.split(','),
+            [float(d) for d in args.degrees.split(',')])
+        records = run_cases(args.rom, record_case, cases, args.workers)
+        with open(args.corpus, 'w') as f:
+            for r in records:
+                f.write(json.dumps(r) + '\n')
+        print('Recorded {0} cases in {1:.1f} seconds.'.format(
+            len(records), time() - start))
+        return
+
+    with open(args.corpus) as f:
+        cases = [json.loads(line) for line in f if line.strip()]
+    failures = [r for r in run_cases(args.rom, check_case, cases,
+                                     args.workers) if r is not None]
+    for failure in failures:
+        print(json.dumps(failure))
+    print('Checked {0} cases in {1:.1f} seconds, {2} changed.'.format(
+        len(cases), time() - start, len(failures)))
+    if failures:
+        exit(1)
+
+
+if __name__ == '__main__':
+    main()
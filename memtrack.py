@@ -0,0 +1,112 @@
+import gc
+import json
+import tracemalloc
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+import randomizer
+
+
+GROWTH_THRESHOLD = 0x10000
+SEED_WINDOW = 100
+
+# peaks need tracemalloc.reset_peak, which is new in python 3.9
+TRACK_PEAKS = hasattr(tracemalloc, 'reset_peak')
+
+
+def get_size(value):
+    if hasattr(value, '__len__'):
+        return len(value)
+    return 1
+
+
+class MemoryTracker:
+    def __init__(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.phases = defaultdict(lambda: {
+            'calls': 0, 'allocated': 0, 'peak': 0, 'objects': 0})
+        # only recent seeds are kept, and surviving caches are summarized by
+        # their first and latest sizes, so long-lived workers stay bounded
+        self.seeds = deque(maxlen=SEED_WINDOW)
+        self.num_seeds = 0
+        self.first_retained = None
+        self.baseline = {o.__name__: set(o.__dict__)
+                         for o in randomizer.ALL_OBJECTS}
+        self.survivors = {}
+
+    @contextmanager
+    def track(self, name, phase):
+        objects = len(gc.get_objects())
+        before, _ = tracemalloc.get_traced_memory()
+        if TRACK_PEAKS:
+            tracemalloc.reset_peak()
+        try:
+            yield
+        finally:
+            current, peak = tracemalloc.get_traced_memory()
+            record = self.phases[name, phase]
+            record['calls'] += 1
+            record['allocated'] += current - before
+            if TRACK_PEAKS:
+                record['peak'] = max(record['peak'], peak - before)
+            record['objects'] += len(gc.get_objects()) - objects
+
+    def get_class_caches(self):
+        caches = {}
+        for o in randomizer.ALL_OBJECTS:
+            for attr in sorted(set(o.__dict__) - self.baseline[o.__name__]):
+                value = o.__dict__[attr]
+                if not callable(value):
+                    caches['{0}.{1}'.format(o.__name__, attr)] = \
+                        get_size(value)
+        return caches
+
+    def start_seed(self):
+        # class attributes that survived reset_objects from earlier seeds
+        for key, size in self.get_class_caches().items():
+            if key in self.survivors:
+                self.survivors[key]['latest'] = size
+                self.survivors[key]['seeds'] += 1
+            else:
+                self.survivors[key] = {'first': size, 'latest': size,
+                                       'seeds': 1}
+
+    def end_seed(self, seed):
+        gc.collect()
+        current, _ = tracemalloc.get_traced_memory()
+        if self.first_retained is None:
+            self.first_retained = current
+        self.num_seeds += 1
+        self.seeds.append({'seed': seed, 'retained': current,
+                           'caches': self.get_class_caches()})
+
+    def report(self):
+        phases = defaultdict(dict)
+        for (name, phase), record in sorted(self.phases.items()):
+            phases[name][phase] = dict(record)
+
+        growing = {key: [sizes['first'], sizes['latest']]
+                   for (key, sizes) in self.survivors.items()
+                   if sizes['seeds'] > 1 and sizes['latest'] > sizes['first']}
+        growth = (self.seeds[-1]['retained'] - self.first_retained
+                  if self.seeds else 0)
+        return {'phases': phases,
+                'num_seeds': self.num_seeds,
+                'seeds': list(self.seeds),
+                'surviving_caches': {k: v['latest'] for (k, v)
+                                     in sorted(self.survivors.items())},
+                'growing_caches': growing,
+                'retained_growth': growth,
+                'leak_suspected': bool(growing)
+                or growth > GROWTH_THRESHOLD}
+
+    def save(self, filename):
+        with open(filename, 'w') as f:
+            json.dump(self.report(), f, indent=1)
+
+
+def enable_tracking():
+    if randomizer.MEMORY_TRACKER is None:
+        randomizer.MEMORY_TRACKER = MemoryTracker()
+    return randomizer.MEMORY_TRACKER
@@ -0,0 +1,177 @@
+import json
+import zlib
+from argparse import ArgumentParser
+from mmap import ACCESS_READ, mmap
+from os import path, truncate
+from struct import Struct
+from threading import Lock
+
+
+MAGIC = b'MPPK\x01'
+FORMATS = ['rom', 'ips', 'ips.gz']
+
+# seed, flags, degree, format, data offset, data length,
+# spoiler offset, spoiler length, md5 of the output rom
+INDEX_RECORD = Struct('<q16sdBQIQI16s')
+FLAGS_SIZE = 16
+
+
+def get_index_filename(filename):
+    return filename + '.idx'
+
+
+def normalize_flags(flags):
+    flags = ''.join(sorted(set(flags)))
+    if len(flags.encode('ascii')) > FLAGS_SIZE:
+        raise ValueError('Flags longer than {0} characters do not fit in '
+                         'the pack index: {1}'.format(FLAGS_SIZE, flags))
+    return flags
+
+
+class PackWriter:
+    def __init__(self, filename):
+        self.filename = filename
+        self.lock = Lock()
+        self.pack = open(filename, 'ab')
+        if self.pack.tell() == 0:
+            self.pack.write(MAGIC)
+        # an interrupted batch can leave part of a record at the end of the
+        # index, which would misalign everything appended after it
+        index_filename = get_index_filename(filename)
+        if path.exists(index_filename):
+            size = path.getsize(index_filename)
+            truncate(index_filename, size - (size % INDEX_RECORD.size))
+        self.index = open(index_filename, 'ab')
+
+    def append(self, seed, flags, degree, fmt, data, spoiler=None,
+               checksum=b''):
+        flags = normalize_flags(flags)
+        if isinstance(spoiler, str):
+            spoiler = spoiler.encode('utf8')
+        with self.lock:
+            data_offset = self.pack.tell()
+            self.pack.write(data)
+            spoiler_offset = self.pack.tell()
+            if spoiler is not None:
+                self.pack.write(spoiler)
+            self.pack.flush()
+            # the index is only written once the data is in place
+            self.index.write(INDEX_RECORD.pack(
+                seed, flags.encode('ascii'), degree, FORMATS.index(fmt),
+                data_offset, len(data), spoiler_offset,
+                len(spoiler) if spoiler is not None else 0, checksum))
+            self.index.flush()
+        return data_offset
+
+    def close(self):
+        self.pack.close()
+        self.index.close()
+
+
+class PackReader:
+    def __init__(self, filename):
+        self.pack_file = open(filename, 'rb')
+        self.index_file = open(get_index_filename(filename), 'rb')
+        self.pack = mmap(self.pack_file.fileno(), 0, access=ACCESS_READ)
+        if self.pack[:len(MAGIC)] != MAGIC:
+            raise ValueError('{0} is not a pack file.'.format(filename))
+        if path.getsize(get_index_filename(filename)):
+            self.index = mmap(self.index_file.fileno(), 0,
+                              access=ACCESS_READ)
+        else:
+            self.index = b''
+        self.seeds = {}
+        for i in range(len(self)):
+            seed = INDEX_RECORD.unpack_from(self.index,
+                                            i * INDEX_RECORD.size)[0]
+            self.seeds.setdefault(seed, []).append(i)
+
+    def __len__(self):
+        # a partial record at the end belongs to an interrupted append
+        return len(self.index) // INDEX_RECORD.size
+
+    def get_entry(self, i):
+        (seed, flags, degree, fmt, data_offset, data_length, spoiler_offset,
+         spoiler_length, checksum) = INDEX_RECORD.unpack_from(
+            self.index, i * INDEX_RECORD.size)
+        return {'seed': seed, 'flags': flags.rstrip(b'\x00').decode('ascii'),
+                'degree': degree, 'format': FORMATS[fmt],
+                'offset': data_offset, 'length': data_length,
+                'spoiler_offset': spoiler_offset,
+                'spoiler_length': spoiler_length,
+                'md5': checksum.hex()}
+
+    def entries(self):
+        for i in range(len(self)):
+            yield self.get_entry(i)
+
+    def find(self, seed, flags=None):
+        if flags is not None:
+            flags = normalize_flags(flags)
+        for i in reversed(self.seeds.get(seed, [])):
+            entry = self.get_entry(i)
+            if flags is None or normalize_flags(entry['flags']) == flags:
+                return entry
+        raise KeyError('Seed {0} is not in this pack.'.format(seed))
+
+    def get_data(self, entry):
+        return self.pack[entry['offset']:entry['offset']+entry['length']]
+
+    def get_spoiler(self, entry):
+        if not entry['spoiler_length']:
+            return None
+        offset = entry['spoiler_offset']
+        return self.pack[offset:offset+entry['spoiler_length']].decode(
+            'utf8')
+
+    def close(self):
+        for m in (self.pack, self.index):
+            if isinstance(m, mmap):
+                m.close()
+        self.pack_file.close()
+        self.index_file.close()
+
+
+def main(args=None):
+    parser = ArgumentParser(prog='randomizer.py --pack')
+    parser.add_argument('pack')
+    parser.add_argument('seed', type=int, nargs='?',
+                        help='extract this seed instead of listing')
+    parser.add_argument('--flags', default=None)
+    parser.add_argument('--output', default=None)
+    parser.add_argument('--spoiler', action='store_true',
+                        help='extract the spoiler log instead of the output')
+    args = parser.parse_args(args)
+
+    reader = PackReader(args.pack)
+    try:
+        if args.seed is None:
+            for entry in reader.entries():
+                print(json.dumps(entry))
+            return
+
+        entry = reader.find(args.seed, args.flags)
+        if args.spoiler:
+            spoiler = reader.get_spoiler(entry)
+            if spoiler is None:
+                raise KeyError('Seed {0} has no spoiler.'.format(args.seed))
+            data = spoiler.encode('utf8')
+            extension = 'spoiler.jsonl'
+        else:
+            data = reader.get_data(entry)
+            extension = entry['format']
+            if extension == 'ips.gz':
+                data, extension = zlib.decompress(data), 'ips'
+            if extension == 'rom':
+                extension = 'gb'
+        output = args.output or '{0}.{1}.{2}'.format(
+            path.splitext(path.basename(args.pack))[0], args.seed, extension)
+        with open(output, 'wb') as f:
+            f.write(data)
+        print('Extracted seed {0} to {1}.'.format(args.seed, output))
+    finally:
+        reader.close()
+
+
+if __name__ == '__main__':
+    main()
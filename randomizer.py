@@ -1,23 +1,89 @@
+from sys import argv, exc_info, exit, stderr
+from traceback import print_exc
+
+
+VERSION = 1
+
+MODES = {'--serve': 'server',
+         '--batch': 'batch',
+         '--calibrate': 'calibrate',
+         '--golden': 'golden',
+         '--diff': 'romdiff',
+         '--verify': 'verify',
+         '--variants': 'variants',
+         '--pack': 'pack',
+         '--fuzz': 'fuzz',
+         '--samplers': 'samplecheck',
+         '--rnglog': 'rnglog',
+         '--startup': 'startup',
+         }
+
+
+def print_banner():
+    print('You are using the Final Fantasy Legend II '
+          '"Mighty Power" randomizer version %s.' % VERSION)
+
+
+def run_mode(args):
+    # modes import the tables themselves when they need them, so they are
+    # dispatched before any of the randomizer is loaded. they may run
+    # unattended and print json, so there is no banner and no prompt
+    if args[0] == '--version':
+        print_banner()
+    elif args[0] in ('-h', '--help'):
+        print('usage: randomizer.py [{0}] ...'.format(
+            ' | '.join(['--help', '--version'] + sorted(MODES))))
+        print('Run without arguments to randomize a rom interactively, or '
+              'pass --help after a mode for its options.')
+    else:
+        from importlib import import_module
+        try:
+            import_module(MODES[args[0]]).main(args[1:])
+        except Exception:
+            print_exc()
+            print('ERROR:', exc_info()[1], file=stderr)
+            exit(1)
+    exit()
+
+
+if __name__ == '__main__' and len(argv) > 1 and (
+        argv[1] in MODES or argv[1] in ('-h', '--help', '--version')):
+    run_mode(argv[1:])
+
+
 from randomtools.tablereader import (
     TableObject, get_global_label, tblpath, addresses, get_random_degree,
-    get_activated_patches, mutate_normal, shuffle_normal, write_patch)
+    mutate_normal, set_global_label, set_global_table_filename,
+    set_global_output_filename, set_table_specs, set_random_degree,
+    set_seed, sort_good_order)
 from randomtools.utils import (
-    classproperty, cached_property, get_snes_palette_transformer,
-    read_multi, write_multi, utilrandom as random)
-from randomtools.interface import (
-    get_outfile, get_seed, get_flags, get_activated_codes, activate_code,
-    run_interface, rewrite_snes_meta, clean_and_write, finish_interface)
+    classproperty, cached_property, utilrandom as random)
+from bisect import bisect_left
 from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from copy import copy
+from hashlib import md5
+import os
 from os import path
-from time import time, sleep, gmtime
-from collections import Counter
-from itertools import combinations
-from sys import argv, exc_info
-from traceback import print_exc
+from threading import RLock
 
 
-VERSION = 1
 ALL_OBJECTS = None
+LOADED_SPECS = None
+MEMORY_TRACKER = None
+GENERATE_LOCK = RLock()
+SNAPSHOT_DIR = path.join(path.expanduser('~'), '.cache', 'mighty_power')
+
+
+def get_window_index(max_index, random_degree):
+    # index into a list sorted by closeness, skewed toward the front
+    randval = random.random()
+    if random_degree > 0:
+        randval = randval ** (1 / random_degree)
+    else:
+        randval = 0
+    assert 0 <= randval <= 1
+    return int(round(randval * max_index))
 
 
 class VanillaObject(TableObject):
@@ -25,11 +91,126 @@ class VanillaObject(TableObject):
     flag_description = 'nothing'
 
 
-class ChestObject(TableObject):
+class PointerTableMixin(TableObject):
+    # objects at scattered addresses are read and written through a few
+    # large ranges of the rom instead of one small record at a time
+    pointer_table = None
+    coalesce_gap = 0x100
+
+    @classmethod
+    def get_coalesced_ranges(cls, pointers, length):
+        ranges = []
+        for pointer in sorted(set(pointers)):
+            if ranges and pointer - ranges[-1][1] <= cls.coalesce_gap:
+                ranges[-1][1] = max(ranges[-1][1], pointer + length)
+            else:
+                ranges.append([pointer, pointer + length])
+        return ranges
+
+    @classproperty
+    def table_pointers(cls):
+        if '_table_pointers' in cls.__dict__:
+            return cls._table_pointers
+
+        with open(path.join(tblpath, cls.pointer_table)) as f:
+            cls._table_pointers = [int(line.strip(), 0x10) for line in f
+                                   if line.strip()
+                                   and not line.startswith('#')]
+        return cls.table_pointers
+
+    @classmethod
+    def read_ranges(cls, filename):
+        ranges = cls.get_coalesced_ranges(cls.table_pointers,
+                                          cls.specs.total_size)
+        buffers = []
+        with open(filename, 'rb') as f:
+            for start, finish in ranges:
+                f.seek(start)
+                buffers.append((start, bytearray(f.read(finish - start))))
+        return buffers
+
+    @classmethod
+    def get_range(cls, buffers, pointer):
+        for start, data in buffers:
+            if start <= pointer < start + len(data):
+                return start, data
+        raise IndexError('No buffered range for {0:x}.'.format(pointer))
+
+    @classproperty
+    def coalesce_valid(cls):
+        return cls.pointer_table is not None and all(
+            other in (None, 'int', 'list', 'str')
+            for (_, _, other) in cls.specs.attributes)
+
+    def read_data(self, filename, pointer=None):
+        if pointer is None or not self.coalesce_valid:
+            return super(PointerTableMixin, self).read_data(filename,
+                                                            pointer)
+
+        cls = type(self)
+        if cls.__dict__.get('_read_buffers', (None,))[0] != filename:
+            cls._read_buffers = (filename, cls.read_ranges(filename))
+        start, data = cls.get_range(cls._read_buffers[1], pointer)
+
+        if not hasattr(self, 'old_data'):
+            self.old_data = {}
+        offset = pointer - start
+        for attribute, size, other in self.specs.attributes:
+            value = data[offset:offset+size]
+            offset += size
+            if other == 'list':
+                value = list(value)
+            elif other == 'str':
+                value = bytes(value)
+            else:
+                value = int.from_bytes(value, 'little')
+            setattr(self, attribute, value)
+            self.old_data[attribute] = copy(value)
+
+    def write_data(self, filename, pointer=None):
+        cls = type(self)
+        if (pointer is None and self.pointer is None) or \
+                not self.coalesce_valid:
+            return super(PointerTableMixin, self).write_data(filename,
+                                                             pointer)
+
+        if pointer is None:
+            pointer = self.pointer
+        if cls.__dict__.get('_write_buffers', (None,))[0] != filename:
+            cls._write_buffers = (filename, cls.read_ranges(filename))
+        start, data = cls.get_range(cls._write_buffers[1], pointer)
+
+        offset = pointer - start
+        for attribute, size, other in self.specs.attributes:
+            value = getattr(self, attribute)
+            if other in ('list', 'str'):
+                value = bytes(value)
+            else:
+                value = value.to_bytes(size, 'little')
+            assert len(value) == size
+            data[offset:offset+size] = value
+            offset += size
+
+    @classmethod
+    def write_all(cls, filename):
+        super(PointerTableMixin, cls).write_all(filename)
+        if '_write_buffers' not in cls.__dict__:
+            return
+        buffer_filename, buffers = cls._write_buffers
+        with open(buffer_filename, 'r+b') as f:
+            for start, data in buffers:
+                f.seek(start)
+                f.write(data)
+        del(cls._write_buffers)
+
+
+class ChestObject(PointerTableMixin):
     flag = 't'
     flag_description = 'treasure chests'
     custom_random_enable = 't'
 
+    pointer_table = 'chest_pointers.txt'
+
     banned_item_indexes = [0x78, 0x79, 0x7a, 0x7b, 0x7c, 0x7d]
 
     @property
@@ -50,6 +231,11 @@ class ChestObject(TableObject):
     def contents(self):
         return self.contents_lowbyte | ((self.misc - 0xf9) << 8)
 
+    @property
+    def old_contents(self):
+        return (self.old_data['contents_lowbyte']
+                | ((self.old_data['misc'] - 0xf9) << 8))
+
     @classproperty
     def valid_items(cls):
         if hasattr(ChestObject, '_valid_items'):
@@ -70,15 +256,16 @@ class ChestObject(TableObject):
     def intershuffle_valid(self):
         return self.item in self.valid_items
 
-    def mutate(self):
-        if not self.intershuffle_valid:
-            return
-
-        old_item = self.item
-        new_item = self.item.get_similar(
-            candidates=self.valid_items, random_degree=self.random_degree)
-        self.set_contents(new_item.index)
-        new_item = self.item
+    @classmethod
+    def mutate_all(cls):
+        super(ChestObject, cls).mutate_all()
+        # every chest picks from the same items, so they are ranked once
+        chests = [c for c in ChestObject.every if c.intershuffle_valid]
+        new_items = AttributeObject.get_similar_items(
+            [c.item for c in chests], ChestObject.valid_items,
+            ChestObject.random_degree)
+        for chest, new_item in zip(chests, new_items):
+            chest.set_contents(new_item.index)
 
     def cleanup(self):
         if self.contents_lowbyte != self.old_data['contents_lowbyte']:
@@ -91,6 +278,17 @@ class MoveSelectionObject(TableObject):
         assert self.probabilities == sorted(self.probabilities)
         return self.probabilities.index(0xFF) + 1
 
+    @classproperty
+    def by_num_moves(cls):
+        if hasattr(MoveSelectionObject, '_by_num_moves'):
+            return MoveSelectionObject._by_num_moves
+
+        by_num_moves = defaultdict(list)
+        for m in MoveSelectionObject.every:
+            by_num_moves[m.num_moves].append(m)
+        MoveSelectionObject._by_num_moves = dict(by_num_moves)
+        return MoveSelectionObject.by_num_moves
+
 
 class AttributeObject(TableObject):
     flag = 'i'
@@ -130,18 +328,48 @@ class AttributeObject(TableObject):
             return AttributeObject._cached_ranks[self.index]
 
         AttributeObject._cached_ranks = {}
-        attribute_monster_ranks = defaultdict(list)
+        for i, monsters in AttributeObject.usage_index['monsters'].items():
+            ranks = [m.rank for m in monsters if m.intershuffle_valid]
+            if ranks:
+                AttributeObject._cached_ranks[i] = sum(ranks) / len(ranks)
+
+        return self.power_rank
+
+    @classproperty
+    def usage_index(cls):
+        # vanilla shops, monsters, and chests that use each attribute
+        if hasattr(AttributeObject, '_usage_index'):
+            return AttributeObject._usage_index
+
+        usage_index = {'shops': defaultdict(list),
+                       'monsters': defaultdict(list),
+                       'chests': defaultdict(list)}
+        for s in ShopObject.every:
+            for i in s.old_data['item_indexes']:
+                usage_index['shops'][i].append(s)
         for m in MonsterObject.every:
-            if not m.intershuffle_valid:
-                continue
             for i in m.old_data['attribute_indexes']:
-                attribute_monster_ranks[i].append(m.rank)
+                usage_index['monsters'][i].append(m)
+        for c in ChestObject.every:
+            usage_index['chests'][c.old_contents].append(c)
 
-        for i, ranks in attribute_monster_ranks.items():
-            avg = sum(ranks) / len(ranks)
-            AttributeObject._cached_ranks[i] = avg
+        AttributeObject._usage_index = {k: dict(v)
+                                        for (k, v) in usage_index.items()}
+        return cls.usage_index
 
-        return self.power_rank
+    @property
+    def shops_selling(self):
+        return sorted(set(AttributeObject.usage_index['shops'].get(
+            self.index, [])))
+
+    @property
+    def monsters_carrying(self):
+        return sorted(set(AttributeObject.usage_index['monsters'].get(
+            self.index, [])))
+
+    @property
+    def chests_holding(self):
+        return AttributeObject.usage_index['chests'].get(self.index, [])
 
     def get_similar(self, candidates=None, override_outsider=False,
                     random_degree=None, allow_intershuffle_invalid=False):
@@ -155,6 +383,32 @@ class AttributeObject(TableObject):
             random_degree=random_degree,
             allow_intershuffle_invalid=allow_intershuffle_invalid)
 
+    @classmethod
+    def get_similar_items(cls, sources, candidates, random_degree):
+        # one get_similar pick per source over the same candidates, which
+        # are split by use_power_rank and sorted once instead of per call
+        ranked = {}
+        for c in sorted(set(candidates), key=lambda c: (c.rank, c.index)):
+            ranked.setdefault(c.use_power_rank, []).append(c)
+        positions = {c: i for group in ranked.values()
+                     for (i, c) in enumerate(group)}
+        chosen = []
+        for source in sources:
+            group = ranked.get(source.use_power_rank)
+            if not group:
+                chosen.append(source)
+            elif source not in positions:
+                chosen.append(source.get_similar(
+                    candidates=candidates, random_degree=random_degree))
+            elif len(group) == 1:
+                chosen.append(group[0])
+            else:
+                index = mutate_normal(positions[source], minimum=0,
+                                      maximum=len(group) - 1,
+                                      random_degree=random_degree)
+                chosen.append(group[index])
+        return chosen
+
     @property
     def shop_item_class(self):
         if self.is_weapon:
@@ -182,20 +436,11 @@ class AttributeObject(TableObject):
     def is_buyable(self):
         if self.index >= 0xFF:
             return False
-
-        for s in ShopObject.every:
-            if self.index in s.old_data['item_indexes']:
-                return True
-
-        return False
+        return self.index in AttributeObject.usage_index['shops']
 
     @cached_property
     def is_equipped_on_monster(self):
-        for m in MonsterObject.every:
-            if self.index in m.old_data['attribute_indexes']:
-                return True
-
-        return False
+        return self.index in AttributeObject.usage_index['monsters']
 
     def mutate(self):
         if self.get_bit('fixed'):
@@ -250,10 +495,8 @@ class MonsterMeatObject(TableObject):
                 1: 'B',
                 2: 'C'}[self.meat & 0xf]
 
-    @classmethod
-    def randomize_all(cls):
-        super(MonsterMeatObject, cls).randomize_all()
-        random_degree = MonsterMeatObject.random_degree
+    @staticmethod
+    def get_meat_map(random_degree):
         families = list(range(12))
         random.shuffle(families)
         meat_map = {}
@@ -277,7 +520,12 @@ class MonsterMeatObject(TableObject):
                 meat_map[old_value] = new_value
 
         assert sorted(meat_map.keys()) == sorted(meat_map.values())
+        return meat_map
 
+    @classmethod
+    def randomize_all(cls):
+        super(MonsterMeatObject, cls).randomize_all()
+        meat_map = cls.get_meat_map(cls.random_degree)
         for mmo in MonsterMeatObject.every:
             if (mmo.meat in meat_map
                     and MonsterObject.get(mmo.index).is_monster):
@@ -307,14 +555,18 @@ class MonsterEvolutionObject(TableObject):
             self.monster_indexes = [0x9B if i == 0xF7 else i
                                     for i in self.monster_indexes]
 
+    def validate_levels(self):
+        levels = [MonsterObject.get(i).level
+                  for i in sorted(set(self.monster_indexes))]
+        assert len(levels) == 5
+        assert levels == sorted(levels)
+        assert levels[-1] == 0xb
+
     def cleanup(self):
         self.validate()
+        self.validate_levels()
         monsters = [MonsterObject.get(i)
                     for i in sorted(set(self.monster_indexes))]
-        levels = [m.level for m in monsters]
-        assert len(levels) == 5
-        assert levels == sorted(levels)
-        assert levels[-1] == 0xb
         monster_indexes = []
         for level in range(16):
             candidates = [m for m in monsters if m.level <= level]
@@ -528,12 +780,9 @@ class FormationObject(TableObject):
             aas = [self.enemy_indexes[2] == 0 and self.index > 0, False]
             for ((i, fcount), aa) in zip(enumerated_fcounts, aas):
                 counts = fcount.old_data['counts']
-                candidates = [f for f in FormationCountObject.every
-                              if f.validate_boss(counts, allow_add=aa)]
-                if not candidates:
-                    chosen = fcount
-                else:
-                    chosen = random.choice(candidates)
+                chosen = random.choice(
+                    FormationCountObject.boss_compatibility[
+                        tuple(counts), aa])
                 self.counts[i] = chosen.index
                 if aa:
                     old_monsters = [self.monsters[j]
@@ -542,20 +791,14 @@ class FormationObject(TableObject):
                                 / len(old_monsters))
                     avg_hp = (sum([m.hp for m in old_monsters])
                               / len(old_monsters))
-                    candidates = [m for m in MonsterObject.ranked
-                                  if m.intershuffle_valid
-                                  and m.rank < avg_rank
-                                  and m.hp < avg_hp]
-
-                    max_index = len(candidates) - 1
-                    randval = random.random()
-                    randomness = (1-self.random_degree)
-                    if randomness > 0:
-                        randval = randval ** (1 / randomness)
-                    else:
-                        randval = 0
-                    index = int(round((1-randval) * max_index))
-                    chosen = candidates[index]
+                    ranks, monsters = MonsterObject.add_candidates
+                    candidates = [m for m in
+                                  monsters[:bisect_left(ranks, avg_rank)]
+                                  if m.hp < avg_hp]
+                    assert candidates
+                    chosen = old_monsters[0].get_similar_monster(
+                        self.random_degree, candidates=candidates,
+                        exclude=old_monsters)
                     self.enemy_indexes[2] = chosen.index
 
             return
@@ -565,14 +808,8 @@ class FormationObject(TableObject):
             candidates = sorted(
                 FormationCountObject.every,
                 key=lambda fc: (fc.get_distance(counts), fc.signature))
-            max_index = len(candidates) - 1
-            randval = random.random()
-            if self.random_degree > 0:
-                randval = randval ** (1 / self.random_degree)
-            else:
-                randval = 0
-            assert 0 <= randval <= 1
-            index = int(round(randval * max_index))
+            index = get_window_index(len(candidates) - 1,
+                                     self.random_degree)
             chosen = candidates[index]
             self.counts[i] = chosen.index
             assert self.fcounts[i] is chosen
@@ -581,13 +818,10 @@ class FormationObject(TableObject):
         if self.index <= 0xf:
             return
 
-        done_m = []
-        for (i, m) in enumerate(self.monsters):
-            while True:
-                new_m = m.get_similar(random_degree=self.random_degree)
-                if new_m not in done_m:
-                    break
-            done_m.append(new_m)
+        new_monsters = MonsterObject.get_similar_monsters(
+            self.monsters, self.random_degree, replace=False)
+        assert len(set(new_monsters)) == len(new_monsters)
+        for (i, new_m) in enumerate(new_monsters):
             self.enemy_indexes[i] = new_m.index
             assert self.monsters[i] is new_m
 
@@ -620,6 +854,35 @@ class FormationCountObject(TableObject):
         sqs2 = [((a >> 4) - (b >> 4))**2 for (a, b) in zip(self.counts, other)]
         return sum(sqs1 + sqs2) ** 0.5
 
+    @classproperty
+    def boss_compatibility(cls):
+        # compatible count patterns for every vanilla boss pattern, with
+        # and without an added enemy
+        if hasattr(FormationCountObject, '_boss_compatibility'):
+            return FormationCountObject._boss_compatibility
+
+        compatibility = {}
+        for f in FormationObject.every:
+            if f.index > 0xf:
+                continue
+            for c in f.old_data['counts'][:2]:
+                fcount = FormationCountObject.get(c & 0x1f)
+                counts = tuple(fcount.old_data['counts'])
+                for allow_add in (True, False):
+                    if (counts, allow_add) in compatibility:
+                        continue
+                    candidates = [
+                        c for c in FormationCountObject.every
+                        if c.validate_boss(counts, allow_add=allow_add)]
+                    if not candidates:
+                        candidates = [min(
+                            FormationCountObject.every,
+                            key=lambda c: (c.get_distance(counts), c.index))]
+                    compatibility[counts, allow_add] = candidates
+
+        FormationCountObject._boss_compatibility = compatibility
+        return FormationCountObject.boss_compatibility
+
     def validate_boss(self, other, allow_add=True):
         if isinstance(other, FormationCountObject):
             other = other.counts
@@ -854,6 +1117,20 @@ class MonsterObject(TableObject):
         MonsterObject._newfamattr[self.family_key] = sorted(new_attributes)
         return self.new_family_attributes
 
+    @property
+    def new_family_pools(self):
+        # the family's new attributes, split by whether they are usable
+        # in battle, shared by every monster in the family
+        if not hasattr(MonsterObject, '_newfampools'):
+            MonsterObject._newfampools = {}
+        if self.family_key not in MonsterObject._newfampools:
+            attributes = self.new_family_attributes
+            MonsterObject._newfampools[self.family_key] = (
+                attributes,
+                [a for a in attributes if a.get_bit('use_battle')],
+                [a for a in attributes if not a.get_bit('use_battle')])
+        return MonsterObject._newfampools[self.family_key]
+
     @property
     def graphic(self):
         return MonsterGraphicObject.get(self.index).graphic_index
@@ -876,7 +1153,7 @@ class MonsterObject(TableObject):
 
     def read_data(self, filename, pointer=None):
         super(MonsterObject, self).read_data(filename, pointer)
-        f = open(filename, 'r+b')
+        f = open(filename, 'rb')
         f.seek(self.attacks_pointer | 0x30000)
         self.attribute_indexes = []
         for i in range(self.num_attributes):
@@ -933,6 +1210,122 @@ class MonsterObject(TableObject):
         else:
             return rank / 3
 
+    @property
+    def similarity_features(self):
+        stats = [self.old_data[attr] for attr in
+                 ['hp', 'strength', 'agility', 'mana', 'defense']]
+        return (stats, self.old_data['misc_attributes'] >> 4,
+                self.family_key >> 4,
+                frozenset(self.old_data['attribute_indexes']))
+
+    @classproperty
+    def similarity_rows(cls):
+        if hasattr(MonsterObject, '_similarity_rows'):
+            return MonsterObject._similarity_rows
+
+        candidates = [m for m in MonsterObject.every if m.intershuffle_valid]
+        features = {m: m.similarity_features for m in MonsterObject.every}
+        scales = []
+        for i in range(5):
+            values = [features[m][0][i] for m in candidates]
+            mean = sum(values) / len(values)
+            variance = sum((v - mean) ** 2 for v in values) / len(values)
+            scales.append((variance ** 0.5) or 1)
+
+        def get_distance(a, b):
+            (astats, arace, afamily, aattrs) = a
+            (bstats, brace, bfamily, battrs) = b
+            distance = sum(((x - y) / s) ** 2
+                           for (x, y, s) in zip(astats, bstats, scales))
+            distance = distance ** 0.5
+            distance += (arace != brace) + (afamily != bfamily)
+            if aattrs or battrs:
+                distance += 1 - (len(aattrs & battrs) / len(aattrs | battrs))
+            return distance
+
+        MonsterObject._similarity_rows = {}
+        for m in MonsterObject.every:
+            row = sorted(candidates, key=lambda c: (
+                get_distance(features[m], features[c]), c.index))
+            MonsterObject._similarity_rows[m.index] = row
+        return MonsterObject.similarity_rows
+
+    @classproperty
+    def similarity_members(cls):
+        if hasattr(MonsterObject, '_similarity_members'):
+            return MonsterObject._similarity_members
+
+        rows = MonsterObject.similarity_rows
+        MonsterObject._similarity_members = frozenset(
+            next(iter(rows.values())) if rows else [])
+        return MonsterObject.similarity_members
+
+    @classproperty
+    def add_candidates(cls):
+        # shuffle-valid monsters sorted by rank, for picking boss adds
+        if hasattr(MonsterObject, '_add_candidates'):
+            return MonsterObject._add_candidates
+
+        monsters = sorted([m for m in MonsterObject.every
+                           if m.intershuffle_valid],
+                          key=lambda m: (m.rank, m.index))
+        MonsterObject._add_candidates = ([m.rank for m in monsters],
+                                         monsters)
+        return MonsterObject.add_candidates
+
+    @classmethod
+    def get_similar_monsters(cls, sources, random_degree, candidates=None,
+                             exclude=(), replace=True):
+        # one pick per source; without replacement, earlier picks are
+        # excluded from later ones while any other candidate is left.
+        # every similarity row holds the same monsters in its own order, so
+        # the monsters left to pick from are counted once per call. a pick
+        # from a whole row steps over the excluded monsters before it, and
+        # a pick among candidates walks its row up to the chosen monster
+        rows = MonsterObject.similarity_rows
+        members = MonsterObject.similarity_members
+        if candidates is not None:
+            members = members & set(candidates)
+        exclude = set(exclude)
+        excluded = exclude & members
+        chosen = []
+        for source in sources:
+            if not members or (candidates is None
+                               and not source.intershuffle_valid):
+                chosen.append(source)
+            else:
+                if len(excluded) < len(members):
+                    skip, count = excluded, len(members) - len(excluded)
+                else:
+                    skip, count = (), len(members)
+                index = get_window_index(count - 1, random_degree)
+                row = rows[source.index]
+                if candidates is None:
+                    for position in sorted(row.index(m) for m in skip):
+                        if position > index:
+                            break
+                        index += 1
+                    chosen.append(row[index])
+                else:
+                    for m in row:
+                        if m in members and m not in skip:
+                            if index == 0:
+                                break
+                            index -= 1
+                    chosen.append(m)
+            if not replace:
+                exclude.add(chosen[-1])
+                if chosen[-1] in members:
+                    excluded.add(chosen[-1])
+        return chosen
+
+    def get_similar_monster(self, random_degree=None, candidates=None,
+                            exclude=()):
+        if random_degree is None:
+            random_degree = self.random_degree
+        return MonsterObject.get_similar_monsters(
+            [self], random_degree, candidates=candidates, exclude=exclude)[0]
+
     @property
     def sprite_index(self):
         if self.index >= 0xe1:
@@ -956,17 +1349,16 @@ class MonsterObject(TableObject):
         if not old_attributes:
             return
 
+        family_attributes, battle, no_battle = self.new_family_pools
         while len(new_attributes) < num_attributes:
-            if len([a for a in new_attributes
-                    if a.get_bit('use_battle')]) == 0:
-                candidates = [a for a in self.new_family_attributes
-                              if a.get_bit('use_battle')]
-            elif len([a for a in new_attributes
-                      if a.get_bit('use_battle')]) == 7:
-                candidates = [a for a in self.new_family_attributes
-                              if not a.get_bit('use_battle')]
+            num_battle = len([a for a in new_attributes
+                              if a.get_bit('use_battle')])
+            if num_battle == 0:
+                candidates = battle
+            elif num_battle == 7:
+                candidates = no_battle
             else:
-                candidates = self.new_family_attributes
+                candidates = family_attributes
             candidates = [c for c in candidates
                           if c not in new_attributes]
             old_attribute = random.choice(old_attributes)
@@ -993,10 +1385,9 @@ class MonsterObject(TableObject):
         no_use = [a for a in new_attributes if not a.get_bit('use_battle')]
         no_use = sorted(no_use)
 
-        candidates = [m for m in MoveSelectionObject.every
-                      if m.num_moves == len(use_battle)]
         assert 1 <= len(use_battle) <= 7
-        chosen = random.choice(candidates)
+        chosen = random.choice(
+            MoveSelectionObject.by_num_moves.get(len(use_battle), []))
         MonsterLevelObject.get(self.index).set_move_selection_index(
             chosen.index)
 
@@ -1007,6 +1398,16 @@ class MonsterObject(TableObject):
         if self.index <= MonsterObject.MAX_EVOLVE_INDEX:
             self.hp = min(self.hp, 999)
 
+    def validate_attacks(self):
+        assert len(self.attribute_indexes) == self.num_attributes
+        # the attack lists are read through the switchable bank window,
+        # from the start of the vanilla pool up to the end of the bank
+        assert self.attacks_pointer >= 0x4000
+        if hasattr(MonsterObject, 'attacks_address'):
+            assert self.attacks_pointer >= MonsterObject.attacks_address
+        assert ((self.attacks_pointer | 0x30000) + self.num_attributes
+                <= addresses.monster_attacks_end)
+
     def write_data(self, filename, pointer=None):
         if not hasattr(MonsterObject, 'attacks_address'):
             MonsterObject.attacks_address = min(
@@ -1020,22 +1421,20 @@ class MonsterObject(TableObject):
             f.write(b'\x00' * length)
             f.close()
 
-        assert len(self.attribute_indexes) == self.num_attributes
-
         try:
             index = MonsterObject.attacks_data.index(
                 bytearray(self.attribute_indexes))
             self.attacks_pointer = MonsterObject.attacks_address + index
+            self.validate_attacks()
         except ValueError:
             #self.attacks_pointer = MonsterObject.attacks_address
             self.attacks_pointer = (MonsterObject.attacks_address +
                                     len(MonsterObject.attacks_data))
-            assert self.attacks_pointer <= 0xFFFF
+            self.validate_attacks()
 
             f = open(filename, 'r+b')
             f.seek(self.attacks_pointer | 0x30000)
             f.write(bytes(self.attribute_indexes))
-            assert f.tell() <= addresses.monster_attacks_end
             f.close()
 
             MonsterObject.attacks_data += bytearray(self.attribute_indexes)
@@ -1053,21 +1452,73 @@ class RNGObject(TableObject):
 class NameMixin(TableObject):
     @cached_property
     def name(self):
-        return self.decode(self.name_str)
+        return type(self).decoded_names[self.index]
+
+    @classproperty
+    def decoded_names(cls):
+        if '_decoded_names' in cls.__dict__:
+            return cls._decoded_names
+
+        # decode the whole table in one pass when every byte is printable
+        name_strs = [o.name_str for o in cls.every]
+        decoded = b''.join(name_strs).translate(
+            NameMixin.decode_bytes_table).decode('ascii')
+        names = []
+        index = 0
+        for name_str in name_strs:
+            name = decoded[index:index+len(name_str)]
+            index += len(name_str)
+            if '\x00' in name:
+                name = cls.decode(name_str)
+            names.append(name)
+
+        cls._decoded_names = names
+        return cls.decoded_names
 
     @classmethod
     def decode(cls, to_decode):
-        s = ''
-        for c in to_decode:
-            if c in cls.codemap:
-                s += cls.codemap[c]
-            else:
-                s += '<{0:0>2x}>'.format(c)
-        return s
+        return bytes(to_decode).decode('latin1').translate(
+            NameMixin.decode_table)
 
     @classmethod
     def encode(cls, to_encode):
-        return bytes([NameMixin.codemap[s] for s in to_encode])
+        invalid = {c for c in to_encode
+                   if ord(c) not in NameMixin.encode_table}
+        if invalid:
+            raise KeyError('Unable to encode: {0}'.format(
+                ''.join(sorted(invalid))))
+        return to_encode.translate(NameMixin.encode_table).encode('latin1')
+
+    @classproperty
+    def decode_table(cls):
+        if hasattr(NameMixin, '_decode_table'):
+            return NameMixin._decode_table
+
+        NameMixin._decode_table = [
+            NameMixin.codemap[c] if c in NameMixin.codemap
+            else '<{0:0>2x}>'.format(c) for c in range(0x100)]
+        return cls.decode_table
+
+    @classproperty
+    def decode_bytes_table(cls):
+        if hasattr(NameMixin, '_decode_bytes_table'):
+            return NameMixin._decode_bytes_table
+
+        # unknown bytes map to zero and are decoded individually
+        NameMixin._decode_bytes_table = bytes(
+            [ord(NameMixin.codemap[c]) if c in NameMixin.codemap else 0
+             for c in range(0x100)])
+        return cls.decode_bytes_table
+
+    @classproperty
+    def encode_table(cls):
+        if hasattr(NameMixin, '_encode_table'):
+            return NameMixin._encode_table
+
+        NameMixin._encode_table = {
+            ord(k): chr(v) for (k, v) in NameMixin.codemap.items()
+            if isinstance(k, str)}
+        return cls.encode_table
 
     @classproperty
     def codemap(cls):
@@ -1202,17 +1653,24 @@ class ShopObject(TableObject):
         self.item_indexes = [i.index for i in items]
         while len(self.item_indexes) < 8:
             self.item_indexes.append(0xFF)
+        self.validate()
 
+    def validate(self):
+        assert len(self.item_indexes) == 8
+        items = [i for i in self.item_indexes if i < 0xFF]
+        assert self.item_indexes == items + ([0xFF] * (8 - len(items)))
+        prices = [ItemPriceObject.get(i).price for i in items]
+        assert prices == sorted(prices)
 
-def rewrite_title_screen():
-    title_len_1, title_len_2 = 17, 20
-    s1 = 'v{0} SN {1}'.format(VERSION, get_seed())
 
-    if any(hasattr(o, 'custom_random_degree') for o in ALL_OBJECTS):
-        random_degree = 'CUSTOM'
-    else:
-        random_degree = round(get_random_degree() ** 0.5, 2)
-    s2 = '{0} {1}'.format(random_degree, get_flags())
+def get_title_lines(seed, flags, random_degree):
+    title_len_1, title_len_2 = 17, 20
+    # long seeds, such as "<seed>-<variant>", drop the labels to fit
+    for s1 in ['v{0} SN {1}', 'SN {1}', '{1}']:
+        s1 = s1.format(VERSION, seed)
+        if len(s1) <= title_len_1:
+            break
+    s2 = '{0} {1}'.format(random_degree, flags)
 
     s1 = s1.strip()
     s2 = s2.strip()
@@ -1226,8 +1684,26 @@ def rewrite_title_screen():
     s2 = s2[:title_len_2]
     assert len(s1) == title_len_1
     assert len(s2) == title_len_2
+    return s1, s2
+
+
+def rewrite_title_screen(outfile=None, seed=None, flags=None):
+    if None in (outfile, seed, flags):
+        from randomtools.interface import get_outfile, get_seed, get_flags
+    if outfile is None:
+        outfile = get_outfile()
+    if seed is None:
+        seed = get_seed()
+    if flags is None:
+        flags = get_flags()
+
+    if any(hasattr(o, 'custom_random_degree') for o in ALL_OBJECTS):
+        random_degree = 'CUSTOM'
+    else:
+        random_degree = round(get_random_degree() ** 0.5, 2)
+    s1, s2 = get_title_lines(seed, flags, random_degree)
 
-    f = open(get_outfile(), 'r+b')
+    f = open(outfile, 'r+b')
     f.seek(addresses.title_text_1)
     f.write(NameMixin.encode(s1))
     f.seek(addresses.title_text_2)
@@ -1235,15 +1711,446 @@ def rewrite_title_screen():
     f.close()
 
 
+# every TableObject subclass, in the order they are defined
+ALL_OBJECTS = [
+    VanillaObject, PointerTableMixin, ChestObject, MoveSelectionObject,
+    AttributeObject, MonsterMeatObject, MonsterEvolutionObject,
+    RobotStatObject, MonsterLevelObject, UsesObject, StatGrowthObject,
+    MutantSkillsObject, MonsterGraphicObject, FormationObject,
+    FormationCountObject, MonsterSkillObject, MonsterObject, RNGObject,
+    NameMixin, AttributeNameObject, MonsterNameObject, ItemPriceObject,
+    ShopObject]
+
+REGIONS = {'NA': 'FFL2_NA',
+           'JP': 'SAGA2_JP'}
+
+# class-level caches that are derived from one rom and one seed
+CLASS_CACHES = {
+    ChestObject: ['_valid_items', '_read_buffers', '_write_buffers'],
+    AttributeObject: ['_cached_ranks', '_usage_index'],
+    FormationCountObject: ['left_boss_add', 'right_boss_add',
+                           '_boss_compatibility'],
+    AttributeNameObject: ['_decoded_names'],
+    MonsterNameObject: ['_decoded_names'],
+    MonsterObject: ['_famattr', '_exfamattr', '_newfamattr',
+                    'attacks_address', 'attacks_data', '_similarity_rows',
+                    '_similarity_members', '_add_candidates', '_newfampools'],
+    MoveSelectionObject: ['_by_num_moves'],
+    }
+
+
+# class-level caches that depend only on the vanilla rom
+SNAPSHOT_CACHES = {
+    AttributeObject: ['_usage_index'],
+    AttributeNameObject: ['_decoded_names'],
+    MonsterNameObject: ['_decoded_names'],
+    MonsterObject: ['_similarity_rows', '_similarity_members'],
+    MoveSelectionObject: ['_by_num_moves'],
+    }
+
+
+def get_rom_label(data):
+    checksum = md5(data).hexdigest()
+    with open(path.join(tblpath, 'master.txt')) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            label, label_checksum, tables_list = line.split()
+            if label_checksum == checksum:
+                return label, tables_list
+    raise Exception('Unrecognized rom: {0}'.format(checksum))
+
+
+def get_table_classes(tables_list):
+    names = []
+    with open(path.join(tblpath, tables_list)) as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#') and line[0] != '$':
+                names.append(line.split()[0])
+    return [o for o in ALL_OBJECTS if o.__name__ in names]
+
+
+def get_all_flags():
+    return ''.join(sorted({o.flag for o in ALL_OBJECTS
+                           if hasattr(o, 'flag') and o.flag != 'v'}))
+
+
+def reset_objects():
+    for o in ALL_OBJECTS:
+        for attr in ['_every', 'randomized', 'cleaned',
+                     'custom_random_degree'] + CLASS_CACHES.get(o, []):
+            if attr in o.__dict__:
+                delattr(o, attr)
+
+
+def warm_objects(classes):
+    if AttributeObject in classes:
+        AttributeObject.usage_index
+    if MonsterObject in classes:
+        MonsterObject.similarity_rows
+        MonsterObject.similarity_members
+        for m in MonsterObject.every:
+            m.family, m.extended_family
+    if MoveSelectionObject in classes:
+        MoveSelectionObject.by_num_moves
+    for o in (AttributeNameObject, MonsterNameObject):
+        if o in classes:
+            o.decoded_names
+
+
+def load_snapshot_objects(label, tables_list, filename, checksum):
+    # the decoded vanilla objects are saved the first time a rom is
+    # seen, and later loads unpickle them instead of reading the rom
+    import snapshot
+    with open(__file__, 'rb') as f:
+        key = snapshot.get_spec_checksum(tables_list, f.read())
+    snapshot_file = path.join(SNAPSHOT_DIR, '{0}.{1}.snapshot'.format(
+        label, checksum))
+    classes = get_table_classes(tables_list)
+    if not snapshot.load_snapshot(snapshot_file, key, classes, filename):
+        warm_objects(classes)
+        snapshot.save_snapshot(snapshot_file, key, classes,
+                               SNAPSHOT_CACHES)
+
+
+def load_objects(label, tables_list, filename, checksum=None):
+    global LOADED_SPECS
+    set_global_label(label)
+    set_global_output_filename(filename)
+    if LOADED_SPECS != (label, tables_list):
+        set_global_table_filename(tables_list)
+        set_table_specs(ALL_OBJECTS)
+        LOADED_SPECS = (label, tables_list)
+    reset_objects()
+    if MEMORY_TRACKER is not None:
+        MEMORY_TRACKER.start_seed()
+    if checksum is not None and SNAPSHOT_DIR is not None:
+        load_snapshot_objects(label, tables_list, filename, checksum)
+    if MEMORY_TRACKER is not None:
+        for o in get_table_classes(tables_list):
+            with track_phase(o, 'load'):
+                o.every
+
+
+def normalize_flags(flags):
+    flags = ''.join(sorted(set(flags or '')))
+    if not flags:
+        flags = get_all_flags()
+    return flags
+
+
+def configure_objects(seed, flags=None, random_degree=0.5,
+                      custom_degrees=None):
+    flags = normalize_flags(flags)
+    set_seed(seed)
+    random.seed(seed)
+    set_random_degree(random_degree ** 2)
+    for key, value in sorted((custom_degrees or {}).items()):
+        assert 0 <= value <= 1
+        for o in ALL_OBJECTS:
+            if key in (o.__name__, getattr(o, 'custom_random_enable', None)):
+                o.custom_random_degree = value ** 2
+    return flags
+
+
+def track_phase(o, phase):
+    if MEMORY_TRACKER is None:
+        return nullcontext()
+    return MEMORY_TRACKER.track(o.__name__, phase)
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+DRAW_FUNCTIONS = ['random', 'uniform', 'gauss', 'randint', 'randrange',
+                  'getrandbits', 'choice', 'shuffle', 'sample']
+
+
+@contextmanager
+def draw_budget(draws):
+    # budgets count calls to the random number generator rather than
+    # seconds, so a table falls back at the same point of the same seed
+    # on any machine and in any thread
+    if draws is None:
+        yield
+        return
+
+    count = [0]
+
+    def counted(function):
+        def draw(*args, **kwargs):
+            count[0] += 1
+            if count[0] > draws:
+                raise BudgetExceeded
+            return function(*args, **kwargs)
+        return draw
+
+    patched = {}
+    for name in DRAW_FUNCTIONS:
+        if hasattr(random, name):
+            patched[name] = name in vars(random), getattr(random, name)
+            setattr(random, name, counted(patched[name][1]))
+    try:
+        yield
+    finally:
+        for name, (own, function) in patched.items():
+            if own:
+                setattr(random, name, function)
+            else:
+                delattr(random, name)
+
+
+def get_budget(o, budget=None, budgets=None):
+    for key in (o.__name__, o.flag):
+        if budgets and key in budgets:
+            return budgets[key]
+    return budget
+
+
+def snapshot_objects():
+    objects = {obj: {k: copy(v) for (k, v) in obj.__dict__.items()}
+               for o in ALL_OBJECTS for obj in o.every}
+    caches = {o: set(o.__dict__) for o in ALL_OBJECTS}
+    return objects, caches
+
+
+def restore_objects(snapshot):
+    objects, caches = snapshot
+    for obj, attrs in objects.items():
+        obj.__dict__.clear()
+        obj.__dict__.update(attrs)
+    for o in ALL_OBJECTS:
+        for attr in CLASS_CACHES.get(o, []):
+            if attr in o.__dict__ and attr not in caches[o]:
+                delattr(o, attr)
+
+
+def randomize_objects(flags, budget=None, budgets=None, fallbacks=()):
+    # classes that overrun their budget are left vanilla. each class is
+    # reseeded before it randomizes, so passing them back in as fallbacks
+    # skips them without changing the other tables
+    done_fallbacks = []
+    for o in sort_good_order(ALL_OBJECTS):
+        if not (hasattr(o, 'flag') and o.flag in flags):
+            continue
+        if o.__name__ in fallbacks:
+            o.randomized = True
+            done_fallbacks.append(o.__name__)
+            continue
+        draws = get_budget(o, budget, budgets)
+        if draws is None:
+            with track_phase(o, 'randomize'):
+                o.full_randomize()
+            continue
+
+        snapshot = snapshot_objects()
+        try:
+            with track_phase(o, 'randomize'), draw_budget(draws):
+                o.full_randomize()
+        except BudgetExceeded:
+            restore_objects(snapshot)
+            o.randomized = True
+            done_fallbacks.append(o.__name__)
+    return sorted(done_fallbacks)
+
+
+def get_display_flags(flags, fallbacks):
+    # several tables share a flag, so it is only shown in uppercase when
+    # all of them fell back, and a partial fallback is marked with a "'"
+    # (the title screen font has no "*")
+    display = ''
+    partial = False
+    for f in flags:
+        names = {o.__name__ for o in ALL_OBJECTS
+                 if getattr(o, 'flag', None) == f}
+        degraded = names & set(fallbacks)
+        if degraded and degraded == names:
+            display += f.upper()
+        else:
+            display += f
+            partial = partial or bool(degraded)
+    return display + ("'" if partial else '')
+
+
+def clean_objects():
+    objects = sort_good_order(ALL_OBJECTS)
+    for o in objects:
+        with track_phase(o, 'cleanup'):
+            o.full_preclean()
+    for o in objects:
+        with track_phase(o, 'cleanup'):
+            o.full_cleanup()
+
+
+def write_objects(outfile):
+    for o in sort_good_order(ALL_OBJECTS):
+        with track_phase(o, 'write'):
+            o.write_all(outfile)
+
+
+def clean_and_write_objects(outfile):
+    clean_objects()
+    write_objects(outfile)
+
+
+def randomize_file(sourcefile, label, tables_list, seed, flags=None,
+                   random_degree=0.5, custom_degrees=None, checksum=None):
+    # randomize and clean the objects without writing a rom
+    load_objects(label, tables_list, sourcefile, checksum)
+    flags = configure_objects(seed, flags, random_degree, custom_degrees)
+    randomize_objects(flags)
+    clean_objects()
+    return flags
+
+
+def generate_rom(data, label, tables_list, outfile, seed, flags=None,
+                 random_degree=0.5, custom_degrees=None, spoiler=None,
+                 budget=None, budgets=None, fallbacks=(), metadata=None):
+    with open(outfile, 'wb') as f:
+        f.write(data)
+
+    load_objects(label, tables_list, outfile, md5(data).hexdigest())
+    flags = configure_objects(seed, flags, random_degree, custom_degrees)
+    fallbacks = randomize_objects(flags, budget, budgets, fallbacks)
+    clean_and_write_objects(outfile)
+    if label == 'FFL2_NA':
+        rewrite_title_screen(outfile, seed,
+                             get_display_flags(flags, fallbacks))
+    if spoiler is not None:
+        from spoiler import write_spoiler
+        header = {'version': VERSION, 'label': label, 'seed': seed,
+                  'flags': flags, 'degree': random_degree,
+                  'degrees': custom_degrees or {}}
+        if fallbacks:
+            header['fallbacks'] = fallbacks
+        write_spoiler(spoiler, header, names=(label == 'FFL2_NA'))
+    if metadata is not None:
+        metadata.update({'flags': flags, 'fallbacks': fallbacks})
+    if MEMORY_TRACKER is not None:
+        MEMORY_TRACKER.end_seed(seed)
+    return flags
+
+
+def generate_file(sourcefile, outfile, seed, flags=None, random_degree=0.5,
+                  custom_degrees=None, region=None):
+    with open(sourcefile, 'rb') as f:
+        data = f.read()
+    label, tables_list = get_rom_label(data)
+    if region is not None and REGIONS[region] != label:
+        raise Exception('Expected a {0} rom, got {1}.'.format(region, label))
+    flags = generate_rom(data, label, tables_list, outfile, seed, flags,
+                         random_degree, custom_degrees)
+    return label, flags
+
+
+@contextmanager
+def memory_file(data):
+    # anonymous in-memory file that can be opened by name like a rom file
+    if hasattr(os, 'memfd_create'):
+        fd = os.memfd_create('mighty_power')
+        try:
+            os.write(fd, data)
+            yield '/proc/self/fd/{0}'.format(fd)
+        finally:
+            os.close(fd)
+        return
+
+    from tempfile import NamedTemporaryFile
+    f = NamedTemporaryFile(suffix='.gb', delete=False)
+    try:
+        f.write(data)
+        f.close()
+        yield f.name
+    finally:
+        os.remove(f.name)
+
+
+def preload_objects(rom):
+    # parses the table specs and loads (or builds) the snapshot, so that
+    # a long-lived worker is ready before its first generation
+    label, tables_list = get_rom_label(rom)
+    with GENERATE_LOCK, memory_file(rom) as filename:
+        load_objects(label, tables_list, filename, md5(rom).hexdigest())
+
+
+def generate(rom, seed, flags=None, random_degree=0.5, custom_degrees=None,
+             region=None, output='rom', spoiler=None, budget=None,
+             budgets=None, fallbacks=(), metadata=None):
+    if output not in ('rom', 'ips'):
+        raise ValueError('Unknown output format: {0}'.format(output))
+    label, tables_list = get_rom_label(rom)
+    if region is not None and REGIONS[region] != label:
+        raise ValueError('Expected a {0} rom, got {1}.'.format(region, label))
+
+    # the table objects and the randomtools settings are module globals, so
+    # calls from several threads are serialized here; run generations in
+    # separate processes to get any parallelism
+    with GENERATE_LOCK, memory_file(rom) as filename:
+        generate_rom(rom, label, tables_list, filename, seed, flags,
+                     random_degree, custom_degrees, spoiler=spoiler,
+                     budget=budget, budgets=budgets, fallbacks=fallbacks,
+                     metadata=metadata)
+        with open(filename, 'rb') as f:
+            data = f.read()
+
+    if output == 'ips':
+        return make_ips_patch(rom, data)
+    return data
+
+
+def apply_ips_patch(data, patch):
+    assert patch[:5] == b'PATCH'
+    data = bytearray(data)
+    i = 5
+    while patch[i:i+3] != b'EOF':
+        offset = int.from_bytes(patch[i:i+3], 'big')
+        length = int.from_bytes(patch[i+3:i+5], 'big')
+        i += 5
+        if length == 0:
+            length = int.from_bytes(patch[i:i+2], 'big')
+            value = patch[i+2:i+3] * length
+            i += 3
+        else:
+            value = patch[i:i+length]
+            i += length
+        if offset + length > len(data):
+            data.extend(b'\x00' * (offset + length - len(data)))
+        data[offset:offset+length] = value
+    return bytes(data)
+
+
+def make_ips_patch(old, new):
+    assert len(old) == len(new)
+    patch = bytearray(b'PATCH')
+    i = 0
+    while i < len(new):
+        if old[i] == new[i]:
+            i += 1
+            continue
+        start = i
+        while (i < len(new) and i - start < 0xFFFE
+               and (old[i] != new[i] or new[i:i+4] != old[i:i+4])):
+            i += 1
+        if start == 0x454f46:
+            # "EOF" is reserved as an offset
+            start -= 1
+        patch += start.to_bytes(3, 'big')
+        patch += (i - start).to_bytes(2, 'big')
+        patch += new[start:i]
+    patch += b'EOF'
+    return bytes(patch)
+
+
 if __name__ == '__main__':
     try:
-        print ('You are using the Final Fantasy Legend II '
-               '"Mighty Power" randomizer version %s.' % VERSION)
-        print
+        from randomtools.interface import (
+            run_interface, clean_and_write, finish_interface)
 
-        ALL_OBJECTS = [g for g in globals().values()
-                       if isinstance(g, type) and issubclass(g, TableObject)
-                       and g not in [TableObject]]
+        print_banner()
+        print
 
         codes = {
                  }
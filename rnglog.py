@@ -0,0 +1,382 @@
+import json
+import sys
+from argparse import ArgumentParser
+from hashlib import md5
+from os import path
+from struct import Struct
+
+from randomtools.tablereader import TableObject
+from randomtools.utils import utilrandom
+
+from randomizer import VERSION, generate, normalize_flags
+
+
+MAGIC = b'MPRL\x01'
+DOUBLE = Struct('<d')
+ROOT = path.dirname(path.abspath(__file__))
+
+FLOAT_FUNCTIONS = ['random', 'uniform', 'gauss']
+INT_FUNCTIONS = ['randint', 'randrange', 'getrandbits']
+KINDS = {'float': 0, 'int': 1, 'choice': 2, 'shuffle': 3, 'sample': 4,
+         'seed': 5}
+KIND_NAMES = {v: k for (k, v) in KINDS.items()}
+
+LOCAL_FILES = {}
+
+
+def write_varint(out, value):
+    # zigzag encoded, so negative numbers stay short
+    value = (value << 1) if value >= 0 else ((-value << 1) - 1)
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def read_varint(data, i):
+    value = 0
+    shift = 0
+    while True:
+        byte = data[i]
+        i += 1
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        if byte < 0x80:
+            break
+    value = (value >> 1) if not value & 1 else -((value + 1) >> 1)
+    return value, i
+
+
+def get_origin(frame):
+    filename = frame.f_code.co_filename
+    if filename not in LOCAL_FILES:
+        filename = path.abspath(filename)
+        if filename == path.abspath(__file__):
+            LOCAL_FILES[frame.f_code.co_filename] = 'log'
+        elif path.dirname(filename) == ROOT:
+            LOCAL_FILES[frame.f_code.co_filename] = 'local'
+        else:
+            LOCAL_FILES[frame.f_code.co_filename] = 'library'
+    return LOCAL_FILES[frame.f_code.co_filename]
+
+
+def get_context(function):
+    # the randomizer object and method that asked for this decision, and
+    # the library call (get_similar, mutate_normal...) it went through
+    frame = sys._getframe(1)
+    outer = function
+    while frame is not None:
+        origin = get_origin(frame)
+        if origin != 'local':
+            if origin == 'library':
+                outer = frame.f_code.co_name
+            frame = frame.f_back
+            continue
+        owner = frame.f_locals.get('self', frame.f_locals.get('cls'))
+        if isinstance(owner, TableObject):
+            name, index = type(owner).__name__, owner.index
+        elif isinstance(owner, type):
+            name, index = owner.__name__, None
+        else:
+            name, index = '', None
+        return name, index, '{0}.{1}'.format(frame.f_code.co_name, outer)
+    return '', None, outer
+
+
+class DecisionHook:
+    def __init__(self):
+        self.originals = {}
+
+    def install(self):
+        names = (FLOAT_FUNCTIONS + INT_FUNCTIONS
+                 + ['choice', 'shuffle', 'sample', 'seed'])
+        for name in names:
+            if hasattr(utilrandom, name):
+                self.originals[name] = getattr(utilrandom, name)
+                setattr(utilrandom, name, self.wrap(name))
+
+    def uninstall(self):
+        for name, function in self.originals.items():
+            setattr(utilrandom, name, function)
+        self.originals = {}
+
+    def __enter__(self):
+        self.install()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.uninstall()
+
+
+class DecisionRecorder(DecisionHook):
+    def __init__(self):
+        super(DecisionRecorder, self).__init__()
+        self.records = []
+        self.busy = False
+
+    def add(self, function, kind, value):
+        name, index, site = get_context(function)
+        self.records.append((name, index, site, kind, value))
+
+    def wrap(self, name):
+        wrapped = self.originals[name]
+
+        def original(*args, **kwargs):
+            # draws made inside another draw are part of that decision
+            self.busy = True
+            try:
+                return wrapped(*args, **kwargs)
+            finally:
+                self.busy = False
+
+        if name in FLOAT_FUNCTIONS + INT_FUNCTIONS:
+            kind = 'float' if name in FLOAT_FUNCTIONS else 'int'
+
+            def draw(*args, **kwargs):
+                value = original(*args, **kwargs)
+                self.add(name, kind, value)
+                return value
+        elif name == 'choice':
+            def draw(seq):
+                i = original(range(len(seq)))
+                self.add(name, 'choice', i)
+                return seq[i]
+        elif name == 'shuffle':
+            def draw(seq):
+                permutation = list(range(len(seq)))
+                original(permutation)
+                self.add(name, 'shuffle', permutation)
+                seq[:] = [seq[i] for i in permutation]
+        elif name == 'sample':
+            def draw(population, k):
+                population = list(population)
+                chosen = original(range(len(population)), k)
+                self.add(name, 'sample', chosen)
+                return [population[i] for i in chosen]
+        else:
+            def draw(*args, **kwargs):
+                value = args[0] if args else kwargs.get('a')
+                if isinstance(value, int):
+                    self.add(name, 'seed', value)
+                return original(*args, **kwargs)
+
+        def guarded(*args, **kwargs):
+            if self.busy:
+                return wrapped(*args, **kwargs)
+            return draw(*args, **kwargs)
+        return guarded
+
+    def save(self, filename, header):
+        names = sorted({r[0] for r in self.records})
+        sites = sorted({r[2] for r in self.records})
+        header = dict(header, classes=names, sites=sites)
+        name_ids = {n: i for (i, n) in enumerate(names)}
+        site_ids = {s: i for (i, s) in enumerate(sites)}
+
+        out = bytearray()
+        for name, index, site, kind, value in self.records:
+            write_varint(out, name_ids[name])
+            write_varint(out, -1 if index is None else index)
+            write_varint(out, site_ids[site])
+            out.append(KINDS[kind])
+            if kind == 'float':
+                out += DOUBLE.pack(value)
+            elif kind in ('shuffle', 'sample'):
+                write_varint(out, len(value))
+                for v in value:
+                    write_varint(out, v)
+            else:
+                write_varint(out, value)
+
+        header = json.dumps(header).encode('utf8')
+        with open(filename, 'wb') as f:
+            f.write(MAGIC + len(header).to_bytes(4, 'little') + header)
+            f.write(out)
+
+
+def read_log(filename):
+    with open(filename, 'rb') as f:
+        data = f.read()
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError('{0} is not a decision log.'.format(filename))
+    i = len(MAGIC) + 4
+    length = int.from_bytes(data[len(MAGIC):i], 'little')
+    header = json.loads(data[i:i+length].decode('utf8'))
+    i += length
+
+    records = []
+    while i < len(data):
+        name, i = read_varint(data, i)
+        index, i = read_varint(data, i)
+        site, i = read_varint(data, i)
+        kind = KIND_NAMES[data[i]]
+        i += 1
+        if kind == 'float':
+            value, = DOUBLE.unpack_from(data, i)
+            i += DOUBLE.size
+        elif kind in ('shuffle', 'sample'):
+            count, i = read_varint(data, i)
+            value = []
+            for _ in range(count):
+                v, i = read_varint(data, i)
+                value.append(v)
+        else:
+            value, i = read_varint(data, i)
+        records.append((header['classes'][name],
+                        None if index < 0 else index,
+                        header['sites'][site], kind, value))
+    return header, records
+
+
+class ReplayError(Exception):
+    pass
+
+
+class DecisionReplayer(DecisionHook):
+    def __init__(self, records):
+        super(DecisionReplayer, self).__init__()
+        self.records = records
+        self.position = 0
+
+    def next(self, kind):
+        if self.position >= len(self.records):
+            raise ReplayError('The log ended after {0} decisions.'.format(
+                self.position))
+        record = self.records[self.position]
+        if record[3] != kind:
+            raise ReplayError('Decision {0} is a {1} in the log, but the '
+                              'randomizer asked for a {2}.'.format(
+                                  self.position, record[3], kind))
+        self.position += 1
+        return record[4]
+
+    def wrap(self, name):
+        if name in FLOAT_FUNCTIONS + INT_FUNCTIONS:
+            kind = 'float' if name in FLOAT_FUNCTIONS else 'int'
+
+            def draw(*args, **kwargs):
+                return self.next(kind)
+        elif name == 'choice':
+            def draw(seq):
+                return seq[self.next('choice')]
+        elif name == 'shuffle':
+            def draw(seq):
+                permutation = self.next('shuffle')
+                seq[:] = [seq[i] for i in permutation]
+        elif name == 'sample':
+            def draw(population, k):
+                population = list(population)
+                return [population[i] for i in self.next('sample')]
+        else:
+            def draw(*args, **kwargs):
+                value = args[0] if args else kwargs.get('a')
+                if isinstance(value, int):
+                    self.next('seed')
+        return draw
+
+
+def format_record(n, record):
+    name, index, site, kind, value = record
+    return {'decision': n, 'class': name, 'index': index, 'site': site,
+            'kind': kind, 'value': value}
+
+
+def first_difference(records_a, records_b):
+    for n, (a, b) in enumerate(zip(records_a, records_b)):
+        if a != b:
+            return n, a, b
+    if len(records_a) != len(records_b):
+        n = min(len(records_a), len(records_b))
+        return (n, records_a[n] if n < len(records_a) else None,
+                records_b[n] if n < len(records_b) else None)
+    return None
+
+
+def record_seed(rom, logfile, seed, flags=None, random_degree=0.5,
+                custom_degrees=None):
+    flags = normalize_flags(flags)
+    with DecisionRecorder() as recorder:
+        data = generate(rom, seed, flags, random_degree, custom_degrees)
+    recorder.save(logfile, {'version': VERSION, 'seed': seed,
+                            'flags': flags, 'degree': random_degree,
+                            'degrees': custom_degrees or {},
+                            'rom': md5(rom).hexdigest(),
+                            'output': md5(data).hexdigest()})
+    return data, len(recorder.records)
+
+
+def replay_seed(rom, logfile):
+    # feeds the logged decisions back instead of drawing new ones, and
+    # checks that they rebuild the same output. every candidate list is
+    # still built, so this is a consistency check rather than a shortcut
+    header, records = read_log(logfile)
+    if md5(rom).hexdigest() != header['rom']:
+        raise ReplayError('{0} was recorded from a different rom.'.format(
+            logfile))
+    with DecisionReplayer(records) as replayer:
+        data = generate(rom, header['seed'], header['flags'],
+                        header['degree'], header['degrees'])
+    if replayer.position != len(records):
+        raise ReplayError('Only {0} of {1} decisions were replayed.'.format(
+            replayer.position, len(records)))
+    if md5(data).hexdigest() != header['output']:
+        raise ReplayError('The replayed output does not match the recorded '
+                          'output.')
+    return data
+
+
+def main(args=None):
+    parser = ArgumentParser(prog='randomizer.py --rnglog')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    record = subparsers.add_parser('record')
+    record.add_argument('rom')
+    record.add_argument('log')
+    record.add_argument('--seed', type=int, required=True)
+    record.add_argument('--flags', default='')
+    record.add_argument('--degree', type=float, default=0.5)
+    record.add_argument('--output', default=None)
+    replay = subparsers.add_parser('replay')
+    replay.add_argument('rom')
+    replay.add_argument('log')
+    replay.add_argument('--output', default=None)
+    bisect = subparsers.add_parser('bisect')
+    bisect.add_argument('log_a')
+    bisect.add_argument('log_b')
+    args = parser.parse_args(args)
+
+    if args.command == 'bisect':
+        _, records_a = read_log(args.log_a)
+        _, records_b = read_log(args.log_b)
+        difference = first_difference(records_a, records_b)
+        if difference is None:
+            print('The logs agree on all {0} decisions.'.format(
+                len(records_a)))
+            return
+        n, a, b = difference
+        if n > 0:
+            print(json.dumps(dict(format_record(n - 1, records_a[n - 1]),
+                                  agreed=True)))
+        for label, record in (('a', a), ('b', b)):
+            if record is None:
+                print(json.dumps({'decision': n, 'log': label,
+                                  'ended': True}))
+            else:
+                print(json.dumps(dict(format_record(n, record), log=label)))
+        sys.exit(1)
+
+    with open(args.rom, 'rb') as f:
+        rom = f.read()
+    if args.command == 'record':
+        data, count = record_seed(rom, args.log, args.seed, args.flags,
+                                  args.degree)
+        print('Recorded {0} decisions to {1}.'.format(count, args.log))
+    else:
+        data = replay_seed(rom, args.log)
+        print('Replayed {0}; the output matches.'.format(args.log))
+    if args.output is not None:
+        with open(args.output, 'wb') as f:
+            f.write(data)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,215 @@
+import json
+from argparse import ArgumentParser
+from bisect import bisect_right
+from os import path
+
+from randomtools.tablereader import tblpath
+
+
+BLOCK_SIZE = 0x400
+TITLE_LENGTHS = {'title_text_1': 17, 'title_text_2': 20}
+
+
+def read_fields(filename):
+    fields = []
+    with open(path.join(tblpath, filename)) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            values = line.split(',')
+            name = values[0]
+            if values[1].startswith('bit:'):
+                size, kind = 1, 'int'
+            else:
+                size = int(values[1])
+                kind = values[2] if len(values) > 2 else 'int'
+            fields.append((name, size, kind))
+    return fields
+
+
+def read_pointers(filename):
+    with open(path.join(tblpath, filename)) as f:
+        return [int(line.strip(), 0x10) for line in f
+                if line.strip() and not line.startswith('#')]
+
+
+class RomLayout:
+    def __init__(self, tables_list):
+        self.regions = []
+        self.tables = {}
+        self.addresses = {}
+        with open(path.join(tblpath, tables_list)) as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                values = line.split()
+                if values[0].startswith('$'):
+                    self.addresses[values[0][1:]] = int(values[1], 0x10)
+                    continue
+                name, table_file = values[:2]
+                fields = read_fields(table_file)
+                total_size = sum(size for (_, size, _) in fields)
+                if len(values) == 3:
+                    pointers = read_pointers(values[2])
+                else:
+                    base, count = int(values[2], 0x10), int(values[3])
+                    if not base or not total_size:
+                        continue
+                    pointers = [base + (i * total_size)
+                                for i in range(count)]
+                self.tables[name] = (fields, pointers)
+                for index, pointer in enumerate(pointers):
+                    offset = pointer
+                    for field, size, kind in fields:
+                        self.regions.append(
+                            (offset, offset + size, name, index, field,
+                             kind))
+                        offset += size
+
+        for name, length in TITLE_LENGTHS.items():
+            if name in self.addresses:
+                start = self.addresses[name]
+                self.regions.append((start, start + length, name, 0, 'text',
+                                     'str'))
+        self.regions.sort()
+        self.starts = [r[0] for r in self.regions]
+
+    def find_region(self, offset):
+        i = bisect_right(self.starts, offset) - 1
+        if i >= 0 and self.regions[i][0] <= offset < self.regions[i][1]:
+            return self.regions[i]
+        return None
+
+    def get_value(self, data, region):
+        start, finish, _, _, _, kind = region
+        value = data[start:finish]
+        if kind == 'list':
+            return list(value)
+        if kind == 'str':
+            return value.hex()
+        return int.from_bytes(value, 'little')
+
+    def read_table(self, data, name):
+        fields, pointers = self.tables[name]
+        objects = []
+        for pointer in pointers:
+            values = {}
+            for field, size, kind in fields:
+                region = (pointer, pointer + size, name, None, field, kind)
+                values[field] = self.get_value(data, region)
+                pointer += size
+            objects.append(values)
+        return objects
+
+    def get_attacks(self, data):
+        if 'MonsterObject' not in self.tables:
+            return {}
+        fields, pointers = self.tables['MonsterObject']
+        offsets = {}
+        offset = 0
+        for field, size, _ in fields:
+            offsets[field] = (offset, size)
+            offset += size
+
+        attacks = {}
+        for index, pointer in enumerate(pointers):
+            values = {}
+            for field in ('misc_attributes', 'attacks_pointer'):
+                offset, size = offsets[field]
+                values[field] = int.from_bytes(
+                    data[pointer+offset:pointer+offset+size], 'little')
+            num_attributes = (values['misc_attributes'] & 0xf) + 1
+            start = values['attacks_pointer'] | 0x30000
+            attacks[index] = (start, list(data[start:start+num_attributes]))
+        return attacks
+
+
+def changed_offsets(old, new):
+    assert len(old) == len(new)
+    for block in range(0, len(new), BLOCK_SIZE):
+        if old[block:block+BLOCK_SIZE] == new[block:block+BLOCK_SIZE]:
+            continue
+        for offset in range(block, min(block + BLOCK_SIZE, len(new))):
+            if old[offset] != new[offset]:
+                yield offset
+
+
+def diff_roms(layout, old, new):
+    old_attacks = layout.get_attacks(old)
+    new_attacks = layout.get_attacks(new)
+    if old_attacks:
+        pool_start = min(start for (start, _) in old_attacks.values())
+        pool_end = layout.addresses.get('monster_attacks_end', pool_start)
+    else:
+        pool_start = pool_end = None
+
+    changes = []
+    seen = set()
+    pool_changed = False
+    for offset in changed_offsets(old, new):
+        if pool_start is not None and pool_start <= offset < pool_end:
+            pool_changed = True
+            continue
+        region = layout.find_region(offset)
+        if region is None:
+            changes.append({'table': None, 'offset': offset,
+                            'old': old[offset], 'new': new[offset]})
+            continue
+        if region in seen:
+            continue
+        seen.add(region)
+        _, _, table, index, field, _ = region
+        if table == 'MonsterObject' and field == 'attacks_pointer':
+            continue
+        changes.append({'table': table, 'index': index, 'field': field,
+                        'offset': region[0],
+                        'old': layout.get_value(old, region),
+                        'new': layout.get_value(new, region)})
+
+    if pool_changed or any(old_attacks[i][0] != new_attacks[i][0]
+                           for i in old_attacks):
+        for index in sorted(old_attacks):
+            (old_start, old_list), (_, new_list) = (old_attacks[index],
+                                                    new_attacks[index])
+            if old_list != new_list:
+                changes.append({'table': 'MonsterObject', 'index': index,
+                                'field': 'attribute_indexes',
+                                'offset': old_start,
+                                'old': old_list, 'new': new_list})
+    return changes
+
+
+def main(args=None):
+    from randomizer import get_rom_label
+
+    parser = ArgumentParser(prog='randomizer.py --diff')
+    parser.add_argument('vanilla')
+    parser.add_argument('roms', nargs='+')
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args(args)
+
+    with open(args.vanilla, 'rb') as f:
+        old = f.read()
+    _, tables_list = get_rom_label(old)
+    layout = RomLayout(tables_list)
+    for filename in args.roms:
+        with open(filename, 'rb') as f:
+            new = f.read()
+        for change in diff_roms(layout, old, new):
+            if args.json:
+                print(json.dumps(dict(change, rom=filename)))
+            elif change['table'] is None:
+                print('{0} {1:0>5x} {2:0>2x} -> {3:0>2x}'.format(
+                    filename, change['offset'], change['old'],
+                    change['new']))
+            else:
+                print('{0} {1:0>5x} {2} {3:0>2x} {4}: {5} -> {6}'.format(
+                    filename, change['offset'], change['table'],
+                    change['index'], change['field'], change['old'],
+                    change['new']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,352 @@
+import json
+from argparse import ArgumentParser
+from collections import Counter
+from importlib import import_module
+from math import exp, lgamma, log, sqrt
+from sys import exit
+from time import time
+
+from randomtools.tablereader import mutate_normal, shuffle_normal
+from randomtools.utils import utilrandom as random
+
+from randomizer import (AttributeObject, MonsterMeatObject, MonsterObject,
+                        get_window_index)
+
+
+ALPHA = 0.001
+MIN_BIN = 10
+DEGREES = [0.0625, 0.25, 0.5625, 1]
+SYNTHETIC_MONSTERS = 24
+SYNTHETIC_ITEMS = 40
+
+
+# reference samplers, copied from the randomizer as they were when these
+# checks were written; optimized versions must match their distributions
+
+def reference_window_index(max_index, random_degree):
+    randval = random.random()
+    if random_degree > 0:
+        randval = randval ** (1 / random_degree)
+    else:
+        randval = 0
+    return int(round(randval * max_index))
+
+
+def reference_meat_map(random_degree):
+    families = list(range(12))
+    random.shuffle(families)
+    meat_map = {}
+    for i, f in enumerate(families):
+        meat_classes = [0, 1, 2]
+        if random.random() < (random_degree ** 0.5):
+            random.shuffle(meat_classes)
+            checks = ['a', 'b']
+            random.shuffle(checks)
+            for check in checks:
+                if check == 'a' and (meat_classes[0] == max(meat_classes)
+                                     and random.random() > random_degree):
+                    pass
+                if check == 'b' and (meat_classes[-1] == min(meat_classes)
+                                     and random.random() > random_degree):
+                    pass
+        for j, c in enumerate(meat_classes):
+            meat_map[(f << 4) | c] = (i << 4) | j
+    return meat_map
+
+
+def reference_similar_monsters(rows, sources, random_degree,
+                               candidates=None, exclude=(), replace=True):
+    if candidates is not None:
+        candidates = set(candidates)
+    exclude = set(exclude)
+    chosen = []
+    for source in sources:
+        if candidates is None:
+            row = rows[source.index] if source.intershuffle_valid else []
+        else:
+            row = [m for m in rows[source.index] if m in candidates]
+        if exclude:
+            filtered = [m for m in row if m not in exclude]
+            if filtered:
+                row = filtered
+        if row:
+            chosen.append(
+                row[reference_window_index(len(row) - 1, random_degree)])
+        else:
+            chosen.append(source)
+        if not replace:
+            exclude.add(chosen[-1])
+    return chosen
+
+
+def reference_similar_items(sources, candidates, random_degree):
+    # get_similar as the chests called it, once per chest
+    chosen = []
+    for source in sources:
+        row = sorted({c for c in candidates
+                      if c.use_power_rank == source.use_power_rank},
+                     key=lambda c: (c.rank, c.index))
+        if len(row) <= 1:
+            chosen.append(row[0] if row else source)
+            continue
+        index = mutate_normal(row.index(source), minimum=0,
+                              maximum=len(row) - 1,
+                              random_degree=random_degree)
+        chosen.append(row[index])
+    return chosen
+
+
+def live_similar_monsters(rows, sources, random_degree, candidates=None,
+                          exclude=(), replace=True):
+    # the live lookup reads its rows from the class cache
+    MonsterObject._similarity_rows = rows
+    try:
+        return MonsterObject.get_similar_monsters(
+            sources, random_degree, candidates=candidates, exclude=exclude,
+            replace=replace)
+    finally:
+        del(MonsterObject._similarity_rows)
+        if hasattr(MonsterObject, '_similarity_members'):
+            del(MonsterObject._similarity_members)
+
+
+def gamma_q(s, x):
+    # regularized upper incomplete gamma function
+    if x <= 0:
+        return 1.0
+    if x < s + 1:
+        term = total = 1 / s
+        n = s
+        while abs(term) > abs(total) * 1e-12:
+            n += 1
+            term *= x / n
+            total += term
+        return 1 - total * exp(-x + s * log(x) - lgamma(s))
+
+    b = x + 1 - s
+    c = 1e300
+    d = 1 / b
+    h = d
+    for i in range(1, 1000):
+        an = -i * (i - s)
+        b += 2
+        d = an * d + b
+        d = 1 / d if abs(d) > 1e-300 else 1e300
+        c = b + an / c
+        if abs(c) < 1e-300:
+            c = 1e-300
+        delta = d * c
+        h *= delta
+        if abs(delta - 1) < 1e-12:
+            break
+    return exp(-x + s * log(x) - lgamma(s)) * h
+
+
+def chi_square(a, b):
+    # two-sample test of homogeneity, with sparse outcomes pooled
+    a, b = Counter(a), Counter(b)
+    total_a, total_b = sum(a.values()), sum(b.values())
+    bins = []
+    pooled = [0, 0]
+    for key in sorted(set(a) | set(b), key=repr):
+        if a[key] + b[key] >= MIN_BIN:
+            bins.append((a[key], b[key]))
+        else:
+            pooled[0] += a[key]
+            pooled[1] += b[key]
+    if sum(pooled):
+        bins.append(tuple(pooled))
+    if len(bins) < 2:
+        return 0.0, 1.0
+
+    ratio = sqrt(total_b / total_a)
+    statistic = sum((x * ratio - y / ratio) ** 2 / (x + y)
+                    for (x, y) in bins)
+    return statistic, gamma_q((len(bins) - 1) / 2, statistic / 2)
+
+
+def kolmogorov_smirnov(a, b):
+    a, b = sorted(a), sorted(b)
+    i = j = 0
+    statistic = 0
+    while i < len(a) and j < len(b):
+        value = min(a[i], b[j])
+        while i < len(a) and a[i] == value:
+            i += 1
+        while j < len(b) and b[j] == value:
+            j += 1
+        statistic = max(statistic, abs(i / len(a) - j / len(b)))
+
+    n = sqrt(len(a) * len(b) / (len(a) + len(b)))
+    x = (n + 0.12 + 0.11 / n) * statistic
+    p = 2 * sum((-1) ** (k - 1) * exp(-2 * (k * x) ** 2)
+                for k in range(1, 101))
+    return statistic, min(max(p, 0.0), 1.0)
+
+
+def draw_window_index(sampler, size):
+    return {'max={0} degree={1}'.format(max_index, degree):
+            [sampler(max_index, degree) for _ in range(size)]
+            for max_index in (8, 64, 255) for degree in DEGREES}
+
+
+def draw_meat_map(sampler, size):
+    # the entries of one permutation depend on each other, so each
+    # permutation only counts once in every case
+    samples = {}
+    for degree in DEGREES:
+        meat_maps = [sampler(degree) for _ in range(size)]
+        samples['degree={0} first'.format(degree)] = [
+            m[0] for m in meat_maps]
+        samples['degree={0} reordered'.format(degree)] = [
+            sum(any(m[(f << 4) | c] & 0xf != c for c in range(3))
+                for f in range(12)) for m in meat_maps]
+    return samples
+
+
+class SyntheticMonster:
+    def __init__(self, index):
+        self.index = index
+        self.intershuffle_valid = index % 6 != 5
+
+
+def draw_similar_monsters(sampler, size):
+    # rows sorted by distance along the index line, with every sixth
+    # monster left out of them like the shuffle-invalid monsters
+    monsters = [SyntheticMonster(i) for i in range(SYNTHETIC_MONSTERS)]
+    valid = [m for m in monsters if m.intershuffle_valid]
+    rows = {m.index: sorted(valid, key=lambda c: (abs(c.index - m.index),
+                                                  c.index))
+            for m in monsters}
+    sources = [monsters[3], monsters[5], monsters[4]]
+    cases = [(None, [], True), (None, [], False),
+             (monsters[:16], [monsters[3]], False)]
+
+    samples = {}
+    for degree in DEGREES:
+        for n, (candidates, exclude, replace) in enumerate(cases):
+            picks = [sampler(rows, sources, degree, candidates, exclude,
+                             replace) for _ in range(size)]
+            for i in range(len(sources)):
+                samples['degree={0} case={1} pick={2}'.format(
+                    degree, n, i)] = [p[i].index for p in picks]
+    return samples
+
+
+class SyntheticItem:
+    def __init__(self, index):
+        self.index = index
+        self.rank = index // 3
+        self.use_power_rank = index % 8 == 7
+
+
+def draw_similar_items(sampler, size):
+    # ranks with ties, and a few items ranked apart by use_power_rank like
+    # the fixed items
+    items = [SyntheticItem(i) for i in range(SYNTHETIC_ITEMS)]
+    sources = [items[0], items[7], items[20], items[39]]
+    samples = {}
+    for degree in DEGREES:
+        picks = [sampler(sources, items, degree) for _ in range(size)]
+        for i in range(len(sources)):
+            samples['degree={0} pick={1}'.format(degree, i)] = [
+                p[i].index for p in picks]
+    return samples
+
+
+def draw_mutate_normal(sampler, size):
+    return {'base={0} range={1}-{2} degree={3} wide={4}'.format(
+        base, minimum, maximum, degree, wide):
+            [sampler(base, minimum=minimum, maximum=maximum,
+                     random_degree=degree, wide=wide)
+             for _ in range(size)]
+            for (base, minimum, maximum) in [(5, 1, 8), (100, 0, 255),
+                                             (500, 1, 10000)]
+            for degree in DEGREES for wide in (False, True)}
+
+
+def draw_shuffle_normal(sampler, size):
+    return {'degree={0}'.format(degree):
+            [(item, position) for _ in range(size // 8 + 1)
+             for (position, item) in enumerate(
+                 sampler(list(range(8)), random_degree=degree))]
+            for degree in DEGREES}
+
+
+# name: (driver, reference, live implementation, numeric outcomes)
+SAMPLERS = {
+    'window_index': (draw_window_index, reference_window_index,
+                     get_window_index, True),
+    'meat_map': (draw_meat_map, reference_meat_map,
+                 MonsterMeatObject.get_meat_map, False),
+    'similar_monsters': (draw_similar_monsters, reference_similar_monsters,
+                         live_similar_monsters, False),
+    'similar_items': (draw_similar_items, reference_similar_items,
+                      AttributeObject.get_similar_items, False),
+    'mutate_normal': (draw_mutate_normal, mutate_normal, None, True),
+    'shuffle_normal': (draw_shuffle_normal, shuffle_normal, None, False),
+    }
+
+
+def load_function(spec):
+    module, name = spec.split(':')
+    function = import_module(module)
+    for attr in name.split('.'):
+        function = getattr(function, attr)
+    return function
+
+
+def check_sampler(name, candidate, size, seed):
+    driver, reference, live, numeric = SAMPLERS[name]
+    candidate = candidate or live
+    if candidate is None:
+        return [{'sampler': name, 'skipped': 'no candidate to compare'}]
+
+    random.seed(seed)
+    expected = driver(reference, size)
+    random.seed(seed + 1)
+    actual = driver(candidate, size)
+    results = []
+    for key in sorted(expected):
+        statistic, p = chi_square(expected[key], actual[key])
+        result = {'sampler': name, 'case': key, 'chi_square': statistic,
+                  'p': p}
+        if numeric:
+            statistic, ks_p = kolmogorov_smirnov(expected[key], actual[key])
+            result.update({'ks': statistic, 'p': min(p, ks_p)})
+        result['passed'] = result['p'] >= ALPHA
+        results.append(result)
+    return results
+
+
+def main(args=None):
+    parser = ArgumentParser(prog='randomizer.py --samplers')
+    parser.add_argument('samplers', nargs='*', default=sorted(SAMPLERS))
+    parser.add_argument('--candidate', action='append', default=[],
+                        metavar='NAME=MODULE:FUNCTION',
+                        help='compare this replacement with the sampler')
+    parser.add_argument('--size', type=int, default=20000,
+                        help='samples drawn for each case')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(args)
+
+    candidates = {}
+    for spec in args.candidate:
+        name, function = spec.split('=', 1)
+        candidates[name] = load_function(function)
+
+    start = time()
+    failed = 0
+    for name in args.samplers:
+        for result in check_sampler(name, candidates.get(name), args.size,
+                                    args.seed):
+            failed += not result.get('passed', True)
+            print(json.dumps(result))
+    print('Checked {0} samplers in {1:.1f} seconds, {2} cases failed.'.format(
+        len(args.samplers), time() - start, failed))
+    if failed:
+        exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,269 @@
+import asyncio
+import json
+from argparse import ArgumentParser
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.util import Finalize
+from os import getpid
+from time import time
+
+from memtrack import enable_tracking
+from randomizer import REGIONS, generate, preload_objects
+from shared import attach, publish
+
+
+CHUNK_SIZE = 0x10000
+LATENCY_WINDOW = 1000
+MEMORY_SAVE_INTERVAL = 50
+
+VANILLA = {}
+SHARED = []
+MEMORY_REPORT = None
+BUDGET = None
+
+
+def init_worker(shared_names, memory_report=None, budget=None):
+    global MEMORY_REPORT, BUDGET
+    BUDGET = budget
+    for name in shared_names:
+        shared = attach(name)
+        SHARED.append(shared)
+        VANILLA[shared.label] = shared.rom
+        preload_objects(shared.rom)
+    if memory_report is not None:
+        MEMORY_REPORT = '{0}.{1}.json'.format(memory_report, getpid())
+        # finalizers with an exit priority run when the worker shuts down
+        tracker = enable_tracking()
+        Finalize(tracker, tracker.save, args=(MEMORY_REPORT,),
+                 exitpriority=10)
+
+
+def parse_job(job):
+    region = job.get('region', 'NA')
+    if region not in REGIONS:
+        raise ValueError('Unknown region: {0}'.format(region))
+    degree = float(job.get('degree', 0.5))
+    degrees = {k: float(v) for (k, v) in job.get('degrees', {}).items()}
+    for value in [degree] + list(degrees.values()):
+        if not 0 <= value <= 1:
+            raise ValueError('Degrees must be between 0 and 1.')
+    output = job.get('output', 'ips')
+    if output not in ('ips', 'rom'):
+        raise ValueError('Unknown output format: {0}'.format(output))
+    fallbacks = job.get('fallbacks', [])
+    if not isinstance(fallbacks, list):
+        raise ValueError('Fallbacks must be a list of table names.')
+    return {'seed': int(job.get('seed', int(time()))),
+            'flags': str(job.get('flags', '')),
+            'degree': degree,
+            'degrees': degrees,
+            'region': region,
+            'output': output,
+            'fallbacks': [str(f) for f in fallbacks]}
+
+
+def run_job(job):
+    start = time()
+    label = REGIONS[job['region']]
+    if label not in VANILLA:
+        raise ValueError('No {0} rom loaded.'.format(job['region']))
+    metadata = {}
+    result = generate(VANILLA[label], job['seed'], job['flags'],
+                      job['degree'], job['degrees'], output=job['output'],
+                      budget=BUDGET, fallbacks=job['fallbacks'],
+                      metadata=metadata)
+    if MEMORY_REPORT is not None:
+        tracker = enable_tracking()
+        if tracker.num_seeds % MEMORY_SAVE_INTERVAL == 0:
+            tracker.save(MEMORY_REPORT)
+    return result, metadata, time() - start
+
+
+class Metrics:
+    def __init__(self):
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.fallbacks = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.work_times = deque(maxlen=LATENCY_WINDOW)
+
+    @staticmethod
+    def summarize(values):
+        if not values:
+            return None
+        values = sorted(values)
+        return {'mean': round(sum(values) / len(values), 4),
+                'p50': round(values[len(values) // 2], 4),
+                'p95': round(values[int(len(values) * 0.95)], 4),
+                'max': round(values[-1], 4)}
+
+    def report(self):
+        return {'queue_depth': self.queued,
+                'running': self.running,
+                'completed': self.completed,
+                'failed': self.failed,
+                'fallbacks': self.fallbacks,
+                'latency': self.summarize(self.latencies),
+                'work_time': self.summarize(self.work_times)}
+
+
+class SeedServer:
+    def __init__(self, romfiles, workers, memory_report=None, budget=None):
+        self.workers = workers
+        # the vanilla roms are published once and shared by every worker
+        self.shared = [publish(romfile) for romfile in romfiles]
+        self.pool = ProcessPoolExecutor(
+            max_workers=workers, initializer=init_worker,
+            initargs=([s.shm.name for s in self.shared], memory_report,
+                      budget))
+        # created in serve(), since before python 3.10 a semaphore binds
+        # to the event loop that exists when it is made
+        self.slots = None
+        self.metrics = Metrics()
+
+    async def generate(self, job):
+        loop = asyncio.get_running_loop()
+        start = time()
+        self.metrics.queued += 1
+        try:
+            async with self.slots:
+                self.metrics.queued -= 1
+                self.metrics.running += 1
+                try:
+                    result = await loop.run_in_executor(
+                        self.pool, run_job, job)
+                finally:
+                    self.metrics.running -= 1
+        except BaseException:
+            self.metrics.failed += 1
+            raise
+        data, metadata, work_time = result
+        self.metrics.completed += 1
+        if metadata['fallbacks']:
+            self.metrics.fallbacks += 1
+        self.metrics.latencies.append(time() - start)
+        self.metrics.work_times.append(work_time)
+        return data, metadata
+
+    async def respond(self, writer, status, body, content_type,
+                      headers=None, chunked=False):
+        lines = ['HTTP/1.1 {0}'.format(status),
+                 'Content-Type: {0}'.format(content_type),
+                 'Connection: close']
+        for key, value in sorted((headers or {}).items()):
+            lines.append('{0}: {1}'.format(key, value))
+        if chunked:
+            lines.append('Transfer-Encoding: chunked')
+        else:
+            lines.append('Content-Length: {0}'.format(len(body)))
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('ascii'))
+        if not chunked:
+            writer.write(body)
+            await writer.drain()
+            return
+
+        for i in range(0, len(body), CHUNK_SIZE):
+            chunk = body[i:i+CHUNK_SIZE]
+            writer.write('{0:x}\r\n'.format(len(chunk)).encode('ascii'))
+            writer.write(chunk + b'\r\n')
+            await writer.drain()
+        writer.write(b'0\r\n\r\n')
+        await writer.drain()
+
+    async def respond_json(self, writer, status, value):
+        body = json.dumps(value).encode('utf8')
+        await self.respond(writer, status, body, 'application/json')
+
+    async def handle(self, reader, writer):
+        try:
+            request_line = (await reader.readline()).decode('latin1')
+            method, target = request_line.split()[:2]
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode('latin1').strip()
+                if not line:
+                    break
+                key, value = line.split(':', 1)
+                headers[key.strip().lower()] = value.strip()
+            length = int(headers.get('content-length', 0))
+            body = await reader.readexactly(length) if length else b''
+
+            if method == 'GET' and target == '/metrics':
+                await self.respond_json(writer, '200 OK',
+                                        self.metrics.report())
+            elif method == 'POST' and target == '/generate':
+                try:
+                    job = parse_job(json.loads(body or b'{}'))
+                except (ValueError, TypeError, AttributeError) as e:
+                    await self.respond_json(writer, '400 Bad Request',
+                                            {'error': str(e)})
+                    return
+                try:
+                    data, metadata = await self.generate(job)
+                except Exception as e:
+                    await self.respond_json(
+                        writer, '500 Internal Server Error',
+                        {'error': str(e), 'seed': job['seed']})
+                    return
+                headers = {'X-Seed': job['seed'],
+                           'X-Flags': metadata['flags'],
+                           'X-Output': job['output']}
+                if metadata['fallbacks']:
+                    headers['X-Fallbacks'] = ','.join(metadata['fallbacks'])
+                await self.respond(
+                    writer, '200 OK', data, 'application/octet-stream',
+                    headers=headers, chunked=True)
+            else:
+                await self.respond_json(writer, '404 Not Found',
+                                        {'error': 'Not found.'})
+        except (ValueError, asyncio.IncompleteReadError,
+                ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def warm(self):
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*[loop.run_in_executor(self.pool, getpid)
+                               for _ in range(self.workers)])
+
+    async def serve(self, host, port):
+        self.slots = asyncio.Semaphore(self.workers)
+        await self.warm()
+        server = await asyncio.start_server(self.handle, host, port)
+        print('Listening on {0}:{1} with {2} workers.'.format(
+            host, port, self.workers))
+        async with server:
+            await server.serve_forever()
+
+
+def main(args=None):
+    parser = ArgumentParser(prog='randomizer.py --serve')
+    parser.add_argument('roms', nargs='+',
+                        help='vanilla FFL2_NA and/or SAGA2_JP roms')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8024)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--memory-report', default=None,
+                        help='save per-class memory usage of each worker '
+                             'to <prefix>.<pid>.json')
+    parser.add_argument('--budget', type=int, default=None,
+                        help='random draws each table may make before it '
+                             'is left vanilla')
+    args = parser.parse_args(args)
+    seed_server = SeedServer(args.roms, args.workers, args.memory_report,
+                             args.budget)
+    try:
+        asyncio.run(seed_server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        seed_server.pool.shutdown()
+        for shared in seed_server.shared:
+            shared.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+import json
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+from randomizer import get_rom_label
+
+
+class SharedVanilla:
+    def __init__(self, shm, owner=False):
+        self.shm = shm
+        self.owner = owner
+        self.view = shm.buf.toreadonly()
+        header_length = int.from_bytes(self.view[:4], 'little')
+        self.index = json.loads(bytes(self.view[4:4+header_length]))
+        self.base = 4 + header_length
+        self.label = self.index['label']
+        self.tables_list = self.index['tables_list']
+
+    @property
+    def rom(self):
+        offset, length = self.index['rom']
+        offset += self.base
+        return self.view[offset:offset+length]
+
+    def close(self):
+        self.view.release()
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def publish(romfile):
+    # only the rom is shared; randomizing mutates the table objects, so each
+    # job restores its own copy of them from the snapshot cache
+    with open(romfile, 'rb') as f:
+        data = f.read()
+    label, tables_list = get_rom_label(data)
+    index = {'label': label, 'tables_list': tables_list,
+             'rom': [0, len(data)]}
+
+    # offsets in the index are relative to the end of the header
+    header = json.dumps(index).encode('utf8')
+    base = 4 + len(header)
+    shm = SharedMemory(create=True, size=base + len(data))
+    shm.buf[:4] = len(header).to_bytes(4, 'little')
+    shm.buf[4:base] = header
+    shm.buf[base:base+len(data)] = data
+    return SharedVanilla(shm, owner=True)
+
+
+def attach(name):
+    try:
+        shm = SharedMemory(name=name, track=False)
+    except TypeError:
+        # before python 3.13, attaching also registers the segment for
+        # cleanup, which would unlink it when this process exits
+        shm = SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    return SharedVanilla(shm)
@@ -0,0 +1,195 @@
+import hmac
+import json
+import os
+import pickle
+from hashlib import md5, sha256
+from io import BytesIO
+from mmap import ACCESS_READ, mmap
+from os import getpid, listdir, makedirs, path, remove, replace
+from struct import Struct
+
+import randomtools
+from randomtools.tablereader import TableObject, tblpath
+
+
+MAGIC = b'MPSN'
+SNAPSHOT_VERSION = 2
+HEADER = Struct('<HI')
+MAC_SIZE = 32
+SECRET_FILENAME = 'snapshot.key'
+
+SNAPSHOTS = {}
+LIBRARY_CHECKSUM = None
+
+
+def get_library_checksum():
+    # the decoded objects depend on the table reader as much as on the
+    # specs, so a randomtools update invalidates the snapshots
+    global LIBRARY_CHECKSUM
+    if LIBRARY_CHECKSUM is not None:
+        return LIBRARY_CHECKSUM
+    checksum = md5()
+    directory = path.dirname(path.abspath(randomtools.__file__))
+    for filename in sorted(listdir(directory)):
+        if filename.endswith('.py'):
+            with open(path.join(directory, filename), 'rb') as f:
+                checksum.update(filename.encode('utf8'))
+                checksum.update(f.read())
+    LIBRARY_CHECKSUM = checksum.hexdigest()
+    return LIBRARY_CHECKSUM
+
+
+def is_private(filename):
+    # snapshots are unpickled, so only trust files nobody else can write
+    stat = os.stat(filename)
+    if hasattr(os, 'getuid') and stat.st_uid != os.getuid():
+        return False
+    return not stat.st_mode & 0o022
+
+
+def get_secret(directory, create=False):
+    filename = path.join(directory, SECRET_FILENAME)
+    if create and not path.exists(filename):
+        makedirs(directory, mode=0o700, exist_ok=True)
+        try:
+            fd = os.open(filename, os.O_WRONLY | os.O_CREAT | os.O_EXCL,
+                         0o600)
+        except FileExistsError:
+            pass
+        else:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(os.urandom(32))
+    if not (path.exists(filename) and is_private(filename)
+            and is_private(directory)):
+        return None
+    with open(filename, 'rb') as f:
+        return f.read()
+
+
+def get_spec_checksum(tables_list, source=b''):
+    checksum = md5(source)
+    checksum.update(get_library_checksum().encode('ascii'))
+    filenames = [tables_list]
+    with open(path.join(tblpath, tables_list)) as f:
+        for line in f:
+            line = line.split()
+            if line and not line[0].startswith(('#', '$')):
+                filenames.extend(line[1:3])
+    for filename in filenames:
+        filename = path.join(tblpath, filename)
+        if path.exists(filename):
+            with open(filename, 'rb') as f:
+                checksum.update(f.read())
+    return checksum.hexdigest()
+
+
+class SnapshotPickler(pickle.Pickler):
+    def persistent_id(self, obj):
+        if isinstance(obj, TableObject):
+            return type(obj).__name__, obj.index
+        return None
+
+
+class SnapshotUnpickler(pickle.Unpickler):
+    def __init__(self, f, shells):
+        super(SnapshotUnpickler, self).__init__(f)
+        self.shells = shells
+
+    def persistent_load(self, pid):
+        name, index = pid
+        return self.shells[name][index]
+
+
+def save_snapshot(filename, key, classes, caches):
+    header = {'key': key,
+              'classes': [[o.__name__, len(o.every)] for o in classes]}
+    objects = {o.__name__: [dict(obj.__dict__) for obj in o.every]
+               for o in classes}
+    class_caches = {o.__name__: {attr: o.__dict__[attr]
+                                 for attr in caches.get(o, [])
+                                 if attr in o.__dict__}
+                    for o in classes}
+
+    header = json.dumps(header).encode('utf8')
+    partial = '{0}.{1}.partial'.format(filename, getpid())
+    try:
+        secret = get_secret(path.dirname(filename), create=True)
+        if secret is None:
+            return
+        payload = BytesIO()
+        SnapshotPickler(payload, protocol=pickle.HIGHEST_PROTOCOL).dump(
+            (objects, class_caches))
+        payload = payload.getvalue()
+        mac = hmac.new(secret, header + payload, sha256).digest()
+        with open(partial, 'wb') as f:
+            f.write(MAGIC + HEADER.pack(SNAPSHOT_VERSION, len(header)))
+            f.write(header)
+            f.write(mac)
+            f.write(payload)
+        replace(partial, filename)
+    except (pickle.PicklingError, TypeError, AttributeError, OSError):
+        # the snapshot only saves time, so a failure is not fatal
+        if path.exists(partial):
+            remove(partial)
+
+
+def open_snapshot(filename, key):
+    if (filename, key) in SNAPSHOTS:
+        return SNAPSHOTS[filename, key]
+    if not path.exists(filename) or not is_private(filename):
+        return None
+    secret = get_secret(path.dirname(filename))
+    if secret is None:
+        return None
+
+    with open(filename, 'rb') as f:
+        data = mmap(f.fileno(), 0, access=ACCESS_READ)
+    offset = len(MAGIC) + HEADER.size
+    if data[:len(MAGIC)] != MAGIC:
+        data.close()
+        return None
+    version, length = HEADER.unpack_from(data, len(MAGIC))
+    if version != SNAPSHOT_VERSION:
+        data.close()
+        return None
+    header = data[offset:offset+length]
+    mac = data[offset+length:offset+length+MAC_SIZE]
+    offset += length + MAC_SIZE
+    expected = hmac.new(secret, header, sha256)
+    expected.update(data[offset:])
+    if not hmac.compare_digest(mac, expected.digest()):
+        data.close()
+        return None
+    header = json.loads(header.decode('utf8'))
+    if header['key'] != key:
+        data.close()
+        return None
+
+    SNAPSHOTS[filename, key] = (data, offset, header['classes'])
+    return SNAPSHOTS[filename, key]
+
+
+def load_snapshot(filename, key, classes, romfile):
+    snapshot = open_snapshot(filename, key)
+    if snapshot is None:
+        return False
+    data, offset, counts = snapshot
+    classes = {o.__name__: o for o in classes}
+    if sorted(classes) != sorted(name for (name, _) in counts):
+        return False
+
+    shells = {name: [classes[name].__new__(classes[name])
+                     for _ in range(count)]
+              for (name, count) in counts}
+    data.seek(offset)
+    objects, class_caches = SnapshotUnpickler(data, shells).load()
+    for name, dicts in objects.items():
+        for obj, attrs in zip(shells[name], dicts):
+            obj.__dict__.update(attrs)
+            if 'filename' in attrs:
+                obj.filename = romfile
+        classes[name]._every = shells[name]
+    for name, caches in class_caches.items():
+        for attr, value in caches.items():
+            setattr(classes[name], attr, value)
+    return True
@@ -0,0 +1,100 @@
+import json
+
+from randomizer import (
+    AttributeNameObject, ChestObject, FormationCountObject, FormationObject,
+    ItemPriceObject, MonsterEvolutionObject, MonsterLevelObject,
+    MonsterNameObject, MonsterObject, MutantSkillsObject, ShopObject)
+
+
+def attribute_record(index, names):
+    record = {'index': index}
+    if names:
+        record['name'] = AttributeNameObject.get(index).name
+    return record
+
+
+def monster_records(names):
+    for m in MonsterObject.every:
+        level = MonsterLevelObject.get(m.index)
+        probabilities = m.move_selection.probabilities
+        skills = []
+        previous = 0
+        for i, ai in enumerate(m.attribute_indexes):
+            skill = attribute_record(ai, names)
+            if i < len(probabilities) and probabilities[i] > previous:
+                skill['chance'] = probabilities[i] - previous
+                previous = probabilities[i]
+            skills.append(skill)
+        record = {'type': 'monster', 'index': m.index,
+                  'hp': m.hp, 'strength': m.strength, 'agility': m.agility,
+                  'mana': m.mana, 'defense': m.defense,
+                  'level': level.level,
+                  'race': m.misc_attributes >> 4,
+                  'meat': m.meat.meat,
+                  'move_selection': level.move_selection_index,
+                  'skills': skills}
+        if names:
+            record['name'] = MonsterNameObject.get(m.index).name
+        yield record
+
+
+def shop_records(names):
+    for s in ShopObject.every:
+        items = []
+        for i in s.item_indexes:
+            if i >= 0xFF:
+                continue
+            item = attribute_record(i, names)
+            item['price'] = ItemPriceObject.get(i).price
+            items.append(item)
+        yield {'type': 'shop', 'index': s.index, 'items': items}
+
+
+def chest_records(names):
+    for c in ChestObject.every:
+        record = {'type': 'chest', 'index': c.index, 'pointer': c.pointer}
+        record['item'] = attribute_record(c.contents, names)
+        yield record
+
+
+def formation_records(names):
+    for f in FormationObject.every:
+        enemies = []
+        for i in f.enemy_indexes:
+            enemy = {'index': i}
+            if names:
+                enemy['name'] = MonsterNameObject.get(i).name
+            enemies.append(enemy)
+        counts = [FormationCountObject.get(c & 0x1f).counts
+                  for c in f.counts]
+        yield {'type': 'formation', 'index': f.index, 'boss': f.index <= 0xf,
+               'enemies': enemies, 'counts': counts}
+
+
+def evolution_records(names):
+    for e in MonsterEvolutionObject.every:
+        yield {'type': 'evolution', 'index': e.index,
+               'monster_indexes': e.monster_indexes}
+
+
+def mutant_skill_records(names):
+    for mu in MutantSkillsObject.every:
+        yield {'type': 'mutant_skill', 'index': mu.index,
+               'skill': attribute_record(mu.skill_index, names)}
+
+
+SPOILER_SECTIONS = [monster_records, shop_records, chest_records,
+                    formation_records, evolution_records, mutant_skill_records]
+
+
+def spoiler_records(names=True):
+    for section in SPOILER_SECTIONS:
+        yield from section(names)
+
+
+def write_spoiler(f, header=None, names=True):
+    if header is not None:
+        header = dict(header, type='header')
+        f.write(json.dumps(header, separators=(',', ':')) + '\n')
+    for record in spoiler_records(names):
+        f.write(json.dumps(record, separators=(',', ':')) + '\n')
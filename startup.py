@@ -0,0 +1,81 @@
+import json
+import subprocess
+import sys
+from argparse import ArgumentParser
+from os import path
+from time import perf_counter
+
+
+ROOT = path.dirname(path.abspath(__file__))
+SCRIPT = path.join(ROOT, 'randomizer.py')
+
+COMMANDS = [('import', ['-c', 'import randomizer']),
+            ('version', [SCRIPT, '--version']),
+            ('help', [SCRIPT, '--help']),
+            ('verify_help', [SCRIPT, '--verify', '--help']),
+            ('batch_help', [SCRIPT, '--batch', '--help']),
+            ]
+
+
+def time_command(arguments, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = perf_counter()
+        result = subprocess.run([sys.executable] + arguments, cwd=ROOT,
+                                stdin=subprocess.DEVNULL,
+                                stdout=subprocess.DEVNULL,
+                                stderr=subprocess.PIPE)
+        timings.append(perf_counter() - start)
+        if result.returncode != 0:
+            raise Exception(result.stderr.decode('utf8', 'replace'))
+    return sorted(timings)
+
+
+def scan_objects(namespace):
+    from randomtools.tablereader import TableObject
+    return [g for g in list(namespace.values())
+            if isinstance(g, type) and issubclass(g, TableObject)
+            and g is not TableObject]
+
+
+def check_registry(repeats):
+    # the static registry has to list exactly what the old globals() scan
+    # found, in the same order
+    import randomizer
+    scanned = scan_objects(vars(randomizer))
+    assert scanned == randomizer.ALL_OBJECTS, (
+        sorted({o.__name__ for o in scanned}
+               ^ {o.__name__ for o in randomizer.ALL_OBJECTS}))
+
+    start = perf_counter()
+    for _ in range(repeats):
+        scan_objects(vars(randomizer))
+    return (perf_counter() - start) / repeats
+
+
+def main(args=None):
+    parser = ArgumentParser(prog='randomizer.py --startup')
+    parser.add_argument('--repeats', type=int, default=10)
+    parser.add_argument('--output', default=None,
+                        help='save the timings to this file')
+    args = parser.parse_args(args)
+
+    results = []
+    for name, arguments in COMMANDS:
+        timings = time_command(arguments, args.repeats)
+        results.append({'command': name,
+                        'median': timings[len(timings) // 2],
+                        'min': timings[0], 'max': timings[-1]})
+        print(json.dumps(results[-1]))
+    results.append({'command': 'registry_scan',
+                    'mean': check_registry(args.repeats)})
+    print(json.dumps(results[-1]))
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            for result in results:
+                f.write(json.dumps(result) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+import json
+from argparse import ArgumentParser
+from hashlib import md5
+from os import _exit, fork, makedirs, path, remove, waitpid
+from sys import exit
+from time import time
+from traceback import print_exc
+
+from randomtools.tablereader import set_global_output_filename, set_seed
+from randomtools.utils import utilrandom as random
+
+from batch import FORMATS, OutputWriter
+from randomizer import (
+    configure_objects, clean_and_write_objects, get_rom_label, load_objects,
+    randomize_objects, rewrite_title_screen)
+
+
+def get_variant_seed(seed, variant):
+    # the same variant of two base seeds must not make the same draws
+    digest = md5('{0}-{1}'.format(seed, variant).encode('ascii')).digest()
+    return int.from_bytes(digest[:4], 'big')
+
+
+def run_variant(vanilla, label, writer, seed, variant, flags, vary_flags):
+    outfile = path.join(writer.outdir, '.{0}.{1}-{2}.gb'.format(
+        writer.basename, seed, variant))
+    with open(outfile, 'wb') as f:
+        f.write(vanilla)
+    set_global_output_filename(outfile)
+    variant_seed = get_variant_seed(seed, variant)
+    set_seed(variant_seed)
+    random.seed(variant_seed)
+    randomize_objects(vary_flags)
+    clean_and_write_objects(outfile)
+    if label == 'FFL2_NA':
+        rewrite_title_screen(outfile, '{0}-{1}'.format(seed, variant), flags)
+    with open(outfile, 'rb') as f:
+        data = f.read()
+    remove(outfile)
+
+    record = writer.write('{0}-{1}'.format(seed, variant), flags, data)
+    record.update({'seed': seed, 'variant': variant,
+                   'variant_seed': variant_seed, 'vary_flags': vary_flags})
+    with open(path.join(writer.outdir, 'manifest.jsonl'), 'a') as f:
+        f.write(json.dumps(record) + '\n')
+
+
+def run_variants(sourcefile, seed, variants, flags, vary_flags,
+                 random_degree, outdir, fmt='ips', custom_degrees=None,
+                 workers=4):
+    with open(sourcefile, 'rb') as f:
+        vanilla = f.read()
+    label, tables_list = get_rom_label(vanilla)
+    makedirs(outdir, exist_ok=True)
+    basename = path.splitext(path.basename(sourcefile))[0]
+    writer = OutputWriter(vanilla, outdir, basename, fmt, threads=0)
+
+    # shared phase: everything that the variants do not vary
+    load_objects(label, tables_list, sourcefile, md5(vanilla).hexdigest())
+    flags = configure_objects(seed, flags, random_degree, custom_degrees)
+    vary_flags = ''.join(f for f in flags if f in vary_flags)
+    randomize_objects(''.join(f for f in flags if f not in vary_flags))
+
+    # each variant is a copy-on-write fork of the shared state
+    children = set()
+    failed = 0
+    for variant in variants:
+        while len(children) >= workers:
+            pid, status = waitpid(-1, 0)
+            children.discard(pid)
+            failed += bool(status)
+        pid = fork()
+        if pid == 0:
+            try:
+                run_variant(vanilla, label, writer, seed, variant, flags,
+                            vary_flags)
+            except Exception:
+                print_exc()
+                _exit(1)
+            _exit(0)
+        children.add(pid)
+
+    for pid in children:
+        _, status = waitpid(pid, 0)
+        failed += bool(status)
+    return failed
+
+
+def main(args=None):
+    parser = ArgumentParser(prog='randomizer.py --variants')
+    parser.add_argument('rom')
+    parser.add_argument('--seed', type=int, default=int(time()))
+    parser.add_argument('--flags', default='')
+    parser.add_argument('--vary', default='stf',
+                        help='flags that differ between variants')
+    parser.add_argument('--first-variant', type=int, default=0)
+    parser.add_argument('--count', type=int, default=10)
+    parser.add_argument('--degree', type=float, default=0.5)
+    parser.add_argument('--output', default='variants')
+    parser.add_argument('--format', choices=FORMATS, default='ips')
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args(args)
+
+    start = time()
+    variants = range(args.first_variant, args.first_variant + args.count)
+    failed = run_variants(args.rom, args.seed, variants, args.flags,
+                          args.vary, args.degree, args.output,
+                          fmt=args.format, workers=args.workers)
+    print('Generated {0} variants of seed {1} in {2:.1f} seconds, '
+          '{3} failed.'.format(args.count, args.seed, time() - start,
+                               failed))
+    if failed:
+        exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+import json
+import zlib
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from os import listdir, path
+from sys import exit
+from time import time
+
+
+EXTENSIONS = ('.gb', '.ips', '.ips.gz')
+
+VANILLA = None
+
+
+def init_worker(romfile):
+    global VANILLA
+    # both of these load randomtools, so they wait for the first worker
+    # rather than slowing down --help
+    from randomizer import get_rom_label
+    from romdiff import RomLayout
+    with open(romfile, 'rb') as f:
+        data = f.read()
+    label, tables_list = get_rom_label(data)
+    chests = RomLayout(tables_list).read_table(data, 'ChestObject')
+    VANILLA = (data, label, tables_list,
+               [(c['contents_lowbyte'], c['misc']) for c in chests])
+
+
+def read_output(filename):
+    with open(filename, 'rb') as f:
+        data = f.read()
+    if filename.endswith('.gz'):
+        data = zlib.decompress(data)
+    if data[:5] == b'PATCH':
+        from randomizer import apply_ips_patch
+        data = apply_ips_patch(VANILLA[0], data)
+    return data
+
+
+def check_objects(problems, objects, check):
+    for o in objects:
+        try:
+            check(o)
+        except AssertionError as e:
+            problems.append({'table': type(o).__name__, 'index': o.index,
+                             'check': check.__name__, 'error': str(e)})
+
+
+def check_evolution(e):
+    e.validate()
+    e.validate_levels()
+
+
+def check_monster(m):
+    m.num_attributes
+    if m.index not in type(m).banned_monster_indexes:
+        m.validate_attacks()
+
+
+def check_shop(s):
+    s.validate()
+
+
+def check_chest(c):
+    if (c.contents_lowbyte, c.misc) != VANILLA[3][c.index]:
+        assert c.intershuffle_valid
+
+
+# tables are named rather than imported, so that the randomizer is only loaded
+# by the workers that use it
+CHECKS = [('MonsterEvolutionObject', check_evolution),
+          ('MonsterObject', check_monster),
+          ('ShopObject', check_shop),
+          ('ChestObject', check_chest)]
+
+
+def verify_file(filename):
+    import randomizer
+
+    data, label, tables_list, _ = VANILLA
+    problems = []
+    with randomizer.memory_file(read_output(filename)) as romfile:
+        try:
+            randomizer.load_objects(label, tables_list, romfile)
+            for name, check in CHECKS:
+                check_objects(problems, getattr(randomizer, name).every,
+                              check)
+        except Exception as e:
+            problems.append({'table': None, 'error': '{0}: {1}'.format(
+                type(e).__name__, e)})
+    return filename, problems
+
+
+def find_outputs(paths):
+    for p in paths:
+        if not path.isdir(p):
+            yield p
+            continue
+        for filename in sorted(listdir(p)):
+            if filename.endswith(EXTENSIONS):
+                yield path.join(p, filename)
+
+
+def main(args=None):
+    parser = ArgumentParser(prog='randomizer.py --verify')
+    parser.add_argument('vanilla')
+    parser.add_argument('outputs', nargs='+',
+                        help='roms, patches or directories of them')
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args(args)
+
+    start = time()
+    filenames = list(find_outputs(args.outputs))
+    failed = 0
+    with ProcessPoolExecutor(max_workers=args.workers,
+                             initializer=init_worker,
+                             initargs=(args.vanilla,)) as pool:
+        for filename, problems in pool.map(verify_file, filenames,
+                                           chunksize=16):
+            if problems:
+                failed += 1
+            for problem in problems:
+                print(json.dumps(dict(problem, file=filename)))
+    print('Verified {0} outputs in {1:.1f} seconds, {2} failed.'.format(
+        len(filenames), time() - start, failed))
+    if failed:
+        exit(1)
+
+
+if __name__ == '__main__':
+    main()